@@ -1,10 +1,18 @@
 import apsw
-import json
+import orjson
+import queue
 import uuid
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple, Any
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple, Any, Callable
 from chat_history import ChatHistory
 
+def _dumps(obj: Any) -> str:
+    """Serialize to a JSON string with orjson (non-str keys coerced like json.dumps)"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+_loads = orjson.loads
+
 class AgentMemoryManager:
     """Helper class for advanced memory operations"""
     
@@ -29,13 +37,124 @@ class AgentMemoryManager:
             SET importance = importance + 1
             WHERE conversation_id = ? AND content LIKE ?
         ''', (conversation_id, f'%{content_pattern}%'))
+        self.db.state_version += 1
 
 class AgentDB(ChatHistory):
     """Enhanced database class combining chat history with agent state management"""
     
+    # Room for every chat-history and agent statement, so hot paths never re-prepare
+    STATEMENT_CACHE_SIZE = 256
+    
+    # Larger mmap window and page cache than plain chat history (see ChatHistory.configure_connection)
+    MMAP_SIZE = 1073741824  # 1 GiB
+    CACHE_SIZE = -65536     # 64 MiB
+    
+    # Read-only connections serving get_*/retrieve_* concurrently with the writer (WAL only)
+    READER_POOL_SIZE = 4
+    READER_CACHE_SIZE = -16384  # 16 MiB page cache per reader
+    
+    # New messages required before summarize_conversation stores another summary
+    SUMMARY_INTERVAL = 10
+    
+    # Hot-path SQL shared by several methods; identical text lets apsw reuse the prepared statement
+    _SQL_INSERT_STATE = '''
+        INSERT INTO agent_state (conversation_id, state_type, state_data)
+        VALUES (?, ?, ?)
+    '''
+    _SQL_GET_STATE = '''
+        SELECT state_data FROM agent_state
+        WHERE conversation_id = ? AND state_type = ?
+        ORDER BY timestamp DESC, id DESC LIMIT 1
+    '''
+    _SQL_INSERT_MEMORY = '''
+        INSERT INTO agent_memory (conversation_id, memory_type, content, importance)
+        VALUES (?, ?, ?, ?)
+    '''
+    _SQL_INSERT_DECISION = '''
+        INSERT INTO agent_decisions (conversation_id, context, decision)
+        VALUES (?, ?, ?)
+    '''
+    _SQL_UPSERT_PREFERENCE = '''
+        INSERT INTO user_preferences (conversation_id, key, value_json)
+        VALUES (?, ?, ?)
+        ON CONFLICT(conversation_id, key) DO UPDATE
+        SET value_json = excluded.value_json, updated_at = CURRENT_TIMESTAMP
+    '''
+    # Upserts every key of a JSON object in one statement (WHERE true disambiguates the UPSERT parse)
+    _SQL_UPSERT_PREFERENCES = '''
+        INSERT INTO user_preferences (conversation_id, key, value_json)
+        SELECT ?1, j.key, ?2 -> j.fullkey FROM json_each(?2) AS j WHERE true
+        ON CONFLICT(conversation_id, key) DO UPDATE
+        SET value_json = excluded.value_json, updated_at = CURRENT_TIMESTAMP
+    '''
+    _SQL_GET_PREFERENCE = '''
+        SELECT value_json FROM user_preferences
+        WHERE conversation_id = ? AND key = ?
+    '''
+    _SQL_GET_PREFERENCES = '''
+        SELECT key, value_json FROM user_preferences
+        WHERE conversation_id = ?
+    '''
+    
     def __init__(self, db_path: str = "chat_history.db"):
+        # Bumped by every write that can change get_conversation_context (prompt cache key)
+        self.state_version = 0
+        # conversation_id -> message count at the last stored summary
+        self._summarized_counts: Dict[str, int] = {}
+        # Flushes of buffered writes (e.g. CerebrasClient's) run by close() before the connections go
+        self._close_callbacks: List[Callable[[], None]] = []
         super().__init__(db_path)
         self.init_agent_tables()
+        self._reader_pool = self._open_reader_pool()
+    
+    def _open_reader_pool(self) -> Optional[queue.Queue]:
+        """Open read-only connections; without WAL (e.g. :memory:) reads stay on the writer"""
+        if self.journal_mode != 'wal':
+            return None
+        
+        pool = queue.Queue()
+        for _ in range(self.READER_POOL_SIZE):
+            reader = apsw.Connection(
+                self.db_path,
+                flags=apsw.SQLITE_OPEN_READONLY,
+                statementcachesize=self.STATEMENT_CACHE_SIZE
+            )
+            cursor = reader.cursor()
+            cursor.execute('PRAGMA temp_store=MEMORY')
+            cursor.execute(f'PRAGMA mmap_size={int(self.MMAP_SIZE)}')
+            cursor.execute(f'PRAGMA cache_size={int(self.READER_CACHE_SIZE)}')
+            cursor.execute('PRAGMA busy_timeout=3000')
+            pool.put(reader)
+        return pool
+    
+    @contextmanager
+    def _reader(self):
+        """Yield a cursor on a pooled read-only connection.
+        
+        Under WAL readers never block the writer. While a transaction() is open the
+        writer connection is used instead, so reads see the pending writes.
+        """
+        if self._reader_pool is None or self.connection.in_transaction:
+            yield self.connection.cursor()
+            return
+        
+        reader = self._reader_pool.get()
+        cursor = reader.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()  # Resets the statement so the read snapshot is released
+            self._reader_pool.put(reader)
+    
+    def checkpoint(self):
+        """Run a passive WAL checkpoint without blocking readers or writers"""
+        cursor = self.connection.cursor()
+        return cursor.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    
+    def get_data_version(self) -> Tuple[int, int]:
+        """Cheap change marker: context writes made here plus commits seen from other connections"""
+        cursor = self.connection.cursor()
+        return self.state_version, cursor.execute('PRAGMA data_version').fetchone()[0]
     
     def init_agent_tables(self):
         """Create agent-specific tables"""
@@ -93,32 +212,159 @@ class AgentDB(ChatHistory):
             )
         ''')
         
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_agent_state_conv ON agent_state(conversation_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_conv ON tasks(conversation_id)')
+        # Agent decisions table - typed columns instead of a JSON blob in agent_memory
+        # Table creation, copy and cleanup commit together, so an interrupted migration is retried
+        with self.transaction():
+            has_decisions_table = cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'agent_decisions'"
+            ).fetchone()[0]
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS agent_decisions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    decision TEXT NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_decisions_conv
+                ON agent_decisions(conversation_id, timestamp)
+            ''')
+            if not has_decisions_table:
+                # Copy decisions previously stored as JSON agent_memory rows
+                cursor.execute('''
+                    INSERT INTO agent_decisions (conversation_id, context, decision, timestamp)
+                    SELECT conversation_id, content ->> '$.context', content ->> '$.decision', created_at
+                    FROM agent_memory
+                    WHERE memory_type = 'agent_decisions' AND conversation_id IS NOT NULL AND json_valid(content)
+                ''')
+                # Drop the copied rows so count_memories/retrieve_memories/cleanup stop seeing duplicates
+                cursor.execute('''
+                    DELETE FROM agent_memory
+                    WHERE memory_type = 'agent_decisions' AND conversation_id IS NOT NULL AND json_valid(content)
+                ''')
+        
+        # User preferences table - one row per (conversation, key) instead of a JSON blob per change
+        has_preferences_table = cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'user_preferences'"
+        ).fetchone()[0]
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_preferences (
+                conversation_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value_json TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (conversation_id, key),
+                FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+            )
+        ''')
+        if not has_preferences_table:
+            # Migrate the latest legacy 'user_preferences' state blob of each conversation
+            cursor.execute('''
+                INSERT OR IGNORE INTO user_preferences (conversation_id, key, value_json)
+                SELECT s.conversation_id, j.key, s.state_data -> j.fullkey
+                FROM agent_state s, json_each(s.state_data) j
+                WHERE s.id IN (
+                    SELECT MAX(id) FROM agent_state
+                    WHERE state_type = 'user_preferences'
+                    GROUP BY conversation_id
+                )
+            ''')
+        
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_conv ON agent_memory(conversation_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_conv ON sessions(conversation_id)')
+        
+        # Composite indexes that satisfy the hot WHERE + ORDER BY paths without a temp b-tree sort.
+        # Ascending columns are scanned in reverse for DESC orderings, including the id tie-break.
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_agent_state_lookup
+            ON agent_state(conversation_id, state_type, timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_memory_lookup
+            ON agent_memory(memory_type, importance, created_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tasks_active
+            ON tasks(conversation_id, priority DESC, created_at)
+        ''')
+        
+        # Superseded by the composite indexes above, which share the conversation_id prefix
+        cursor.execute('DROP INDEX IF EXISTS idx_agent_state_conv')
+        cursor.execute('DROP INDEX IF EXISTS idx_tasks_conv')
+        
+        # Range-scan support for cleanup_old_states (the memory purge ranges over idx_memory_importance below)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_state_timestamp ON agent_state(timestamp)')
+        
+        # Index-only count for get_agent_stats
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_active ON sessions(last_active)')
+        
+        # Cross-conversation reads issued by sql_tools and get_agent_stats:
+        #   idx_tasks_open            - open tasks in priority order, no sort
+        #   idx_memory_importance     - important memories (importance >= 3), no sort; also the cleanup range
+        #   idx_tasks_status_priority - covering completed count and task status breakdown, no GROUP BY b-tree
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tasks_open
+            ON tasks(priority DESC, created_at) WHERE status != 'completed'
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_memory_importance ON agent_memory(importance, created_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks(status, priority DESC)')
+        
+        # Superseded by idx_tasks_status_priority and idx_memory_importance; each extra index taxes every insert
+        cursor.execute('DROP INDEX IF EXISTS idx_tasks_status')
+        cursor.execute('DROP INDEX IF EXISTS idx_memory_cleanup')
     
     def store_agent_state(self, conversation_id: str, state_type: str, state_data: Dict):
         """Store agent's current state"""
+        if state_type == 'user_preferences':
+            # Preferences live in their own keyed table; a full dict replaces the previous set
+            self.store_user_preferences(conversation_id, state_data, replace=True)
+            return
+        
         cursor = self.connection.cursor()
-        cursor.execute('''
-            INSERT INTO agent_state (conversation_id, state_type, state_data)
-            VALUES (?, ?, ?)
-        ''', (conversation_id, state_type, json.dumps(state_data)))
+        cursor.execute(self._SQL_INSERT_STATE, (conversation_id, state_type, _dumps(state_data)))
+        self.state_version += 1
     
     def get_agent_state(self, conversation_id: str, state_type: str) -> Optional[Dict]:
         """Retrieve latest agent state of specific type"""
-        cursor = self.connection.cursor()
-        result = list(cursor.execute('''
-            SELECT state_data FROM agent_state
-            WHERE conversation_id = ? AND state_type = ?
-            ORDER BY timestamp DESC LIMIT 1
-        ''', (conversation_id, state_type)))
-        
-        if result:
-            return json.loads(result[0][0])
+        if state_type == 'user_preferences':
+            return self.get_user_preferences(conversation_id) or None
+        
+        with self._reader() as cursor:
+            row = cursor.execute(self._SQL_GET_STATE, (conversation_id, state_type)).fetchone()
+        
+        if row:
+            return _loads(row[0])
         return None
     
+    def get_agent_states_bulk(self, conversation_id: str, state_types: List[str]) -> Dict[str, Dict]:
+        """Retrieve the latest state of each requested type in one query, keyed by state type"""
+        states = {}
+        if 'user_preferences' in state_types:
+            preferences = self.get_user_preferences(conversation_id)
+            if preferences:
+                states['user_preferences'] = preferences
+        
+        other_types = [state_type for state_type in state_types if state_type != 'user_preferences']
+        if other_types:
+            placeholders = ', '.join('?' * len(other_types))
+            with self._reader() as cursor:
+                for state_type, state_data in cursor.execute(f'''
+                    SELECT state_type, state_data FROM (
+                        SELECT state_type, state_data,
+                               ROW_NUMBER() OVER (PARTITION BY state_type ORDER BY timestamp DESC, id DESC) AS rn
+                        FROM agent_state
+                        WHERE conversation_id = ? AND state_type IN ({placeholders})
+                    )
+                    WHERE rn = 1
+                ''', (conversation_id, *other_types)):
+                    states[state_type] = _loads(state_data)
+        
+        # Keep the caller's ordering of state types
+        return {state_type: states[state_type] for state_type in state_types if state_type in states}
+    
     def create_task(self, conversation_id: str, task_name: str, description: str = "", priority: int = 1) -> str:
         """Create a new task"""
         task_id = str(uuid.uuid4())
@@ -127,6 +373,7 @@ class AgentDB(ChatHistory):
             INSERT INTO tasks (id, conversation_id, task_name, description, priority)
             VALUES (?, ?, ?, ?, ?)
         ''', (task_id, conversation_id, task_name, description, priority))
+        self.state_version += 1
         return task_id
     
     def update_task_status(self, task_id: str, status: str):
@@ -136,55 +383,92 @@ class AgentDB(ChatHistory):
             UPDATE tasks SET status = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (status, task_id))
+        self.state_version += 1
     
     def get_active_tasks(self, conversation_id: str) -> List[Dict]:
         """Get all active (non-completed) tasks for conversation"""
-        cursor = self.connection.cursor()
         tasks = []
-        for row in cursor.execute('''
-            SELECT id, task_name, description, status, priority, created_at, updated_at
-            FROM tasks
-            WHERE conversation_id = ? AND status != 'completed'
-            ORDER BY priority DESC, created_at ASC
-        ''', (conversation_id,)):
-            tasks.append({
-                'id': row[0],
-                'task_name': row[1],
-                'description': row[2],
-                'status': row[3],
-                'priority': row[4],
-                'created_at': row[5],
-                'updated_at': row[6]
-            })
+        with self._reader() as cursor:
+            for row in cursor.execute('''
+                SELECT id, task_name, description, status, priority, created_at, updated_at
+                FROM tasks
+                WHERE conversation_id = ? AND status != 'completed'
+                ORDER BY priority DESC, created_at ASC
+            ''', (conversation_id,)):
+                tasks.append({
+                    'id': row[0],
+                    'task_name': row[1],
+                    'description': row[2],
+                    'status': row[3],
+                    'priority': row[4],
+                    'created_at': row[5],
+                    'updated_at': row[6]
+                })
         return tasks
     
     def store_memory(self, conversation_id: str, memory_type: str, content: str, importance: int = 1):
         """Store long-term memory"""
         cursor = self.connection.cursor()
-        cursor.execute('''
-            INSERT INTO agent_memory (conversation_id, memory_type, content, importance)
-            VALUES (?, ?, ?, ?)
-        ''', (conversation_id, memory_type, content, importance))
+        cursor.execute(self._SQL_INSERT_MEMORY, (conversation_id, memory_type, content, importance))
+        self.state_version += 1
+    
+    def store_memories_bulk(self, rows: List[Tuple[str, str, str, int]]):
+        """Store many memories in one transaction; rows are (conversation_id, memory_type, content, importance)"""
+        with self.transaction() as cursor:
+            cursor.executemany(self._SQL_INSERT_MEMORY, rows)
+        self.state_version += 1
     
     def retrieve_memories(self, memory_type: str, limit: int = 10) -> List[Dict]:
         """Retrieve memories by type, ordered by importance and recency"""
-        cursor = self.connection.cursor()
         memories = []
-        for row in cursor.execute('''
-            SELECT content, importance, created_at, conversation_id
-            FROM agent_memory
-            WHERE memory_type = ?
-            ORDER BY importance DESC, created_at DESC
-            LIMIT ?
-        ''', (memory_type, limit)):
-            memories.append({
-                'content': row[0],
-                'importance': row[1],
-                'created_at': row[2],
-                'conversation_id': row[3]
-            })
+        with self._reader() as cursor:
+            for row in cursor.execute('''
+                SELECT content, importance, created_at, conversation_id
+                FROM agent_memory
+                WHERE memory_type = ?
+                ORDER BY importance DESC, created_at DESC
+                LIMIT ?
+            ''', (memory_type, limit)):
+                memories.append({
+                    'content': row[0],
+                    'importance': row[1],
+                    'created_at': row[2],
+                    'conversation_id': row[3]
+                })
         return memories
     
+    def count_memories(self, memory_type: str) -> int:
+        """Count memories of a type without fetching them (index-only via idx_memory_lookup)"""
+        with self._reader() as cursor:
+            return cursor.execute(
+                "SELECT COUNT(*) FROM agent_memory WHERE memory_type = ?", (memory_type,)
+            ).fetchone()[0]
+    
+    def retrieve_memories_bulk(self, memory_types: List[str], limit: int = 10) -> Dict[str, List[Dict]]:
+        """Retrieve the top memories of several types in one query, keyed by memory type"""
+        placeholders = ', '.join('?' * len(memory_types))
+        memories = {memory_type: [] for memory_type in memory_types}
+        with self._reader() as cursor:
+            for row in cursor.execute(f'''
+                SELECT memory_type, content, importance, created_at, conversation_id FROM (
+                    SELECT memory_type, content, importance, created_at, conversation_id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY memory_type ORDER BY importance DESC, created_at DESC
+                           ) AS rn
+                    FROM agent_memory
+                    WHERE memory_type IN ({placeholders})
+                )
+                WHERE rn <= ?
+                ORDER BY memory_type, rn
+            ''', (*memory_types, limit)):
+                memories[row[0]].append({
+                    'content': row[1],
+                    'importance': row[2],
+                    'created_at': row[3],
+                    'conversation_id': row[4]
+                })
+        return {memory_type: rows for memory_type, rows in memories.items() if rows}
+    
     def create_session(self, conversation_id: str, session_data: Dict) -> str:
         """Create new session"""
         session_id = str(uuid.uuid4())
@@ -192,7 +476,7 @@ class AgentDB(ChatHistory):
         cursor.execute('''
             INSERT INTO sessions (id, conversation_id, session_data)
             VALUES (?, ?, ?)
-        ''', (session_id, conversation_id, json.dumps(session_data)))
+        ''', (session_id, conversation_id, _dumps(session_data)))
         return session_id
     
     def update_session(self, session_id: str, session_data: Dict):
@@ -202,21 +486,20 @@ class AgentDB(ChatHistory):
             UPDATE sessions 
             SET session_data = ?, last_active = CURRENT_TIMESTAMP
             WHERE id = ?
-        ''', (json.dumps(session_data), session_id))
+        ''', (_dumps(session_data), session_id))
     
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Retrieve session data"""
-        cursor = self.connection.cursor()
-        result = list(cursor.execute('''
-            SELECT conversation_id, session_data, started_at, last_active
-            FROM sessions WHERE id = ?
-        ''', (session_id,)))
+        with self._reader() as cursor:
+            row = cursor.execute('''
+                SELECT conversation_id, session_data, started_at, last_active
+                FROM sessions WHERE id = ?
+            ''', (session_id,)).fetchone()
         
-        if result:
-            row = result[0]
+        if row:
             return {
                 'conversation_id': row[0],
-                'session_data': json.loads(row[1]),
+                'session_data': _loads(row[1]),
                 'started_at': row[2],
                 'last_active': row[3]
             }
@@ -233,39 +516,66 @@ class AgentDB(ChatHistory):
         
         # Get various agent states
         state_types = ['current_task', 'user_preferences', 'conversation_summary']
-        for state_type in state_types:
-            state = self.get_agent_state(conversation_id, state_type)
-            if state:
-                context['agent_state'][state_type] = state
+        context['agent_state'] = {
+            state_type: state
+            for state_type, state in self.get_agent_states_bulk(conversation_id, state_types).items()
+            if state
+        }
         
         # Get relevant memories
         memory_types = ['user_preferences', 'important_facts', 'patterns']
-        for memory_type in memory_types:
-            memories = self.retrieve_memories(memory_type, 5)
-            if memories:
-                context['memories'][memory_type] = memories
+        context['memories'] = self.retrieve_memories_bulk(memory_types, 5)
         
         return context
     
     def store_user_preference(self, conversation_id: str, preference_key: str, preference_value: Any):
         """Store user preference"""
-        preferences = self.get_agent_state(conversation_id, 'user_preferences') or {}
-        preferences[preference_key] = preference_value
-        self.store_agent_state(conversation_id, 'user_preferences', preferences)
+        cursor = self.connection.cursor()
+        cursor.execute(self._SQL_UPSERT_PREFERENCE, (conversation_id, preference_key, _dumps(preference_value)))
+        self.state_version += 1
+    
+    def store_user_preferences(self, conversation_id: str, preferences: Dict, replace: bool = False):
+        """Upsert several user preferences in one statement, optionally dropping keys not in the dict"""
+        with self.transaction() as cursor:
+            if replace:
+                cursor.execute('DELETE FROM user_preferences WHERE conversation_id = ?', (conversation_id,))
+            cursor.execute(self._SQL_UPSERT_PREFERENCES, (conversation_id, _dumps(preferences)))
+        self.state_version += 1
     
     def get_user_preference(self, conversation_id: str, preference_key: str, default=None):
         """Get user preference"""
-        preferences = self.get_agent_state(conversation_id, 'user_preferences') or {}
-        return preferences.get(preference_key, default)
+        with self._reader() as cursor:
+            row = cursor.execute(self._SQL_GET_PREFERENCE, (conversation_id, preference_key)).fetchone()
+        return _loads(row[0]) if row else default
+    
+    def get_user_preferences(self, conversation_id: str) -> Dict:
+        """Get all user preferences for a conversation as a dict"""
+        with self._reader() as cursor:
+            return {
+                key: _loads(value_json)
+                for key, value_json in cursor.execute(self._SQL_GET_PREFERENCES, (conversation_id,))
+            }
+    
+    def count_conversation_messages(self, conversation_id: str) -> int:
+        """Count messages in a conversation without fetching them"""
+        with self._reader() as cursor:
+            return cursor.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
     
     def summarize_conversation(self, conversation_id: str, max_messages: int = 50):
         """Create and store conversation summary for context management"""
-        messages = self.get_conversation_messages(conversation_id)
-        if len(messages) > max_messages:
+        message_count = self.count_conversation_messages(conversation_id)
+        last_count = self._summarized_counts.get(conversation_id)
+        if last_count is not None and message_count - last_count < self.SUMMARY_INTERVAL:
+            return  # Summarized recently; skip the redundant state row
+        
+        if message_count > max_messages:
+            self._summarized_counts[conversation_id] = message_count
             # Store summary for context efficiency
             summary_data = {
-                'total_messages': len(messages),
-                'last_summarized': datetime.now().isoformat(),
+                'total_messages': message_count,
+                'last_summarized': datetime.now(),
                 'key_topics': [],  # Could be enhanced with NLP
                 'user_requests': [],  # Track common user patterns
             }
@@ -273,44 +583,75 @@ class AgentDB(ChatHistory):
     
     def track_agent_decision(self, conversation_id: str, decision_context: str, decision_made: str):
         """Track agent decisions for learning and improvement"""
-        self.store_memory(
-            conversation_id, 
-            'agent_decisions', 
-            json.dumps({
-                'context': decision_context,
-                'decision': decision_made,
-                'timestamp': datetime.now().isoformat()
-            }), 
-            importance=2
-        )
+        cursor = self.connection.cursor()
+        cursor.execute(self._SQL_INSERT_DECISION, (conversation_id, decision_context, decision_made))
+    
+    def track_agent_decisions_bulk(self, decisions: List[Tuple[str, str, str, datetime]]):
+        """Store buffered agent decisions in one transaction; rows are (conversation_id, context, decision, timestamp).
+        
+        Timestamps are stored in UTC like the column's CURRENT_TIMESTAMP default (naive values are taken as local time).
+        """
+        with self.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO agent_decisions (conversation_id, context, decision, timestamp)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (conversation_id, decision_context, decision_made,
+                 timestamp.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+                for conversation_id, decision_context, decision_made, timestamp in decisions
+            ])
+    
+    def get_agent_decisions(self, conversation_id: str, limit: int = 20) -> List[Dict]:
+        """Get the most recent agent decisions for a conversation"""
+        decisions = []
+        with self._reader() as cursor:
+            for row in cursor.execute('''
+                SELECT context, decision, timestamp
+                FROM agent_decisions
+                WHERE conversation_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ''', (conversation_id, limit)):
+                decisions.append({
+                    'context': row[0],
+                    'decision': row[1],
+                    'timestamp': row[2]
+                })
+        return decisions
     
     def cleanup_old_states(self, days: int = 30):
         """Clean up old agent states older than specified days"""
         cursor = self.connection.cursor()
         cursor.execute('''
             DELETE FROM agent_state 
-            WHERE timestamp < datetime('now', '-{} days')
-        '''.format(days))
+            WHERE timestamp < datetime('now', ?)
+        ''', (f'-{int(days)} days',))
         
         cursor.execute('''
             DELETE FROM agent_memory 
-            WHERE created_at < datetime('now', '-{} days') AND importance < 3
-        '''.format(days * 2))  # Keep important memories longer
+            WHERE created_at < datetime('now', ?) AND importance < 3
+        ''', (f'-{int(days) * 2} days',))  # Keep important memories longer
+        
+        cursor.execute('''
+            DELETE FROM agent_decisions 
+            WHERE timestamp < datetime('now', ?)
+        ''', (f'-{int(days) * 2} days',))
+        self.state_version += 1
     
     def get_agent_stats(self) -> Dict:
         """Get comprehensive statistics about agent usage"""
-        cursor = self.connection.cursor()
-        
         # Basic stats from parent class
         base_stats = self.get_conversation_stats()
         
-        # Agent-specific stats
-        total_tasks = list(cursor.execute('SELECT COUNT(*) FROM tasks'))[0][0]
-        completed_tasks = list(cursor.execute("SELECT COUNT(*) FROM tasks WHERE status = 'completed'"))[0][0]
-        total_memories = list(cursor.execute('SELECT COUNT(*) FROM agent_memory'))[0][0]
-        active_sessions = list(cursor.execute(
-            "SELECT COUNT(*) FROM sessions WHERE last_active > datetime('now', '-1 day')"
-        ))[0][0]
+        # Agent-specific stats in a single round-trip
+        with self._reader() as cursor:
+            total_tasks, completed_tasks, total_memories, active_sessions = cursor.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM tasks),
+                    (SELECT COUNT(*) FROM tasks WHERE status = 'completed'),
+                    (SELECT COUNT(*) FROM agent_memory),
+                    (SELECT COUNT(*) FROM sessions WHERE last_active > datetime('now', '-1 day'))
+            ''').fetchone()
         
         return {
             **base_stats,
@@ -319,4 +660,18 @@ class AgentDB(ChatHistory):
             'task_completion_rate': completed_tasks / total_tasks if total_tasks > 0 else 0,
             'total_memories': total_memories,
             'active_sessions': active_sessions
-        }
\ No newline at end of file
+        }
+    
+    def add_close_callback(self, callback: Callable[[], None]):
+        """Register a callback that close() runs while the writer connection is still open"""
+        self._close_callbacks.append(callback)
+    
+    def close(self):
+        """Flush registered write buffers, then close the pooled reader connections and the writer connection"""
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+        if self._reader_pool is not None:
+            while not self._reader_pool.empty():
+                self._reader_pool.get_nowait().close()
+        super().close()
\ No newline at end of file
@@ -1,22 +1,87 @@
 from dotenv import load_dotenv
+import functools
+import hashlib
+import httpx
 import os
-import json
-from cerebras.cloud.sdk import Cerebras
-from typing import List, Dict, Optional
+import re
+import orjson
+from collections import OrderedDict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from cerebras.cloud.sdk import Cerebras, DefaultHttpxClient
+from typing import Any, Callable, List, Dict, Optional
 
 load_dotenv()
 
+# Idle seconds a pooled API connection stays open; the SDK default (5 s) is shorter than a typical
+# pause between chat turns, which would otherwise cost a fresh TCP/TLS handshake per message
+_KEEPALIVE_EXPIRY = 120.0
+
+# Keywords that signal user patterns in analyze_user_pattern (matched as substrings)
+_CODE_KEYWORDS = frozenset({'code', 'function', 'class', 'method'})
+_EXPLANATION_KEYWORDS = frozenset({'explain', 'how', 'why', 'what'})
+# One case-insensitive scan finds every keyword; the lookahead also reports overlapping hits (e.g. "howhy")
+_PATTERN_KEYWORD_RE = re.compile(
+    '(?=(' + '|'.join(sorted(_CODE_KEYWORDS | _EXPLANATION_KEYWORDS)) + '))',
+    re.IGNORECASE
+)
+
+def _named_preference(key: str) -> Callable[[Any], Optional[str]]:
+    return lambda value: f"  - User prefers {key}: {value} - reference when relevant" if isinstance(value, str) else None
+
+# Preference key -> formatter returning a prompt instruction line, or None to skip the key
+_PREF_HANDLERS: Dict[str, Callable[[Any], Optional[str]]] = {
+    'prefers_code_count': lambda value: "  - User frequently requests code examples - provide them proactively" if value > 2 else None,
+    'asks_questions_count': lambda value: "  - User asks many questions - be thorough in explanations" if value > 3 else None,
+    'requests_explanation_count': lambda value: "  - User values detailed explanations - provide comprehensive answers" if value > 2 else None,
+    'avg_message_length': lambda value: "  - User writes detailed messages - match with substantial responses" if value > 100 else None,
+    'language': _named_preference('language'),
+    'framework': _named_preference('framework'),
+    'tool': _named_preference('tool'),
+}
+
+@functools.lru_cache(maxsize=1)
+def _get_sdk_client() -> Cerebras:
+    """Create the SDK client once so every CerebrasClient shares its HTTP connection pool"""
+    api_key = os.getenv('CEREBRAS_API_KEY')
+    if not api_key:
+        raise ValueError("CEREBRAS_API_KEY not found in environment variables")
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=_KEEPALIVE_EXPIRY)
+    )
+    return Cerebras(api_key=api_key, http_client=http_client)
+
 class CerebrasClient:
+    # Completed responses kept for exact-repeat requests (least recently used evicted first)
+    RESPONSE_CACHE_SIZE = 128
+    
+    # Characters shared by task and fact lines in the system prompt; bounds worst-case prompt growth
+    CONTEXT_CHAR_BUDGET = 2048
+    
+    # Buffered response_metrics rows written together once this many responses have accumulated
+    METRICS_FLUSH_EVERY = 5
+    
     def __init__(self, agent_db=None):
-        self.api_key = os.getenv('CEREBRAS_API_KEY')
-        if not self.api_key:
-            raise ValueError("CEREBRAS_API_KEY not found in environment variables")
-        self.client = Cerebras(api_key=self.api_key)
+        self.client = _get_sdk_client()
+        self.api_key = self.client.api_key
         self.agent_db = agent_db
         self.current_conversation_id = None
+        # conversation_id -> (database change marker, rendered system prompt)
+        self._prompt_cache: Dict[str, tuple] = {}
+        # Agent decisions waiting to be written once the response has been delivered
+        self._decision_buffer: List[tuple] = []
+        # Request hash -> completed response text
+        self._response_cache: OrderedDict = OrderedDict()
+        # response_metrics memory rows waiting for the next batched write
+        self._metrics_buffer: List[tuple] = []
+        # Buffered rows must reach the database before it closes
+        if agent_db is not None:
+            agent_db.add_close_callback(self.close)
     
     def set_conversation_context(self, conversation_id: str):
         """Set current conversation context for database integration"""
+        if conversation_id != self.current_conversation_id:
+            self.flush_metrics()  # Close out the previous conversation's metrics
         self.current_conversation_id = conversation_id
     
     def get_enhanced_context(self, messages: List[Dict]) -> List[Dict]:
@@ -24,32 +89,40 @@ class CerebrasClient:
         if not self.agent_db or not self.current_conversation_id:
             return messages
         
-        # Get conversation context from database
-        context = self.agent_db.get_conversation_context(self.current_conversation_id)
-        
-        # Build enhanced context
-        enhanced_messages = []
+        # Reuse the rendered prompt until agent state, tasks, memories or preferences change
+        fingerprint = self.agent_db.get_data_version()
+        cached = self._prompt_cache.get(self.current_conversation_id)
+        if cached and cached[0] == fingerprint:
+            system_prompt = cached[1]
+        else:
+            # Get conversation context from database
+            context = self.agent_db.get_conversation_context(self.current_conversation_id)
+            system_prompt = ""
+            if context.get('agent_state') or context.get('tasks') or context.get('memories'):
+                system_prompt = self._build_memory_aware_system_prompt(context)
+            self._prompt_cache[self.current_conversation_id] = (fingerprint, system_prompt)
         
-        # Add comprehensive system message with memory instructions
-        if context.get('agent_state') or context.get('tasks') or context.get('memories'):
-            system_prompt = self._build_memory_aware_system_prompt(context)
-            if system_prompt:
-                enhanced_messages.append({
-                    "role": "system",
-                    "content": system_prompt
-                })
+        if not system_prompt:
+            return messages
         
-        # Add original messages
-        enhanced_messages.extend(messages)
+        # Merge into an existing system message instead of stacking a second one
+        if messages and messages[0].get('role') == 'system':
+            existing = messages[0]['content']
+            if system_prompt in existing:
+                return messages  # Already enhanced
+            return [{"role": "system", "content": f"{existing}\n\n{system_prompt}"}, *messages[1:]]
         
-        return enhanced_messages
+        # Add comprehensive system message with memory instructions ahead of the original messages
+        return [{"role": "system", "content": system_prompt}, *messages]
     
     def _build_memory_aware_system_prompt(self, context: Dict) -> str:
         """Build comprehensive system prompt with memory utilization instructions"""
-        prompt_sections = []
+        # Every section is appended line-by-line and joined once at the end
+        lines = []
+        budget = self.CONTEXT_CHAR_BUDGET
         
         # Core memory instructions
-        prompt_sections.append("""You are an AI assistant with access to conversation history and learned user preferences. 
+        lines.append("""You are an AI assistant with access to conversation history and learned user preferences. 
 
 MEMORY UTILIZATION INSTRUCTIONS:
 • Reference previous conversations naturally when relevant
@@ -63,26 +136,21 @@ BEHAVIORAL ADAPTATION GUIDELINES:""")
         # User preferences section
         user_prefs = context.get('agent_state', {}).get('user_preferences')
         if user_prefs:
-            pref_instructions = ["• ADAPT YOUR RESPONSES based on these learned preferences:"]
+            header_index = len(lines)
+            lines.append("• ADAPT YOUR RESPONSES based on these learned preferences:")
             for key, value in user_prefs.items():
-                if 'prefers_code' in key and value > 2:
-                    pref_instructions.append("  - User frequently requests code examples - provide them proactively")
-                elif 'asks_questions' in key and value > 3:
-                    pref_instructions.append("  - User asks many questions - be thorough in explanations")
-                elif 'requests_explanation' in key and value > 2:
-                    pref_instructions.append("  - User values detailed explanations - provide comprehensive answers")
-                elif 'avg_message_length' in key and value > 100:
-                    pref_instructions.append("  - User writes detailed messages - match with substantial responses")
-                elif key in ['language', 'framework', 'tool'] and isinstance(value, str):
-                    pref_instructions.append(f"  - User prefers {key}: {value} - reference when relevant")
+                handler = _PREF_HANDLERS.get(key)
+                instruction = handler(value) if handler else None
+                if instruction:
+                    lines.append(instruction)
             
-            if len(pref_instructions) > 1:
-                prompt_sections.append("\n".join(pref_instructions))
+            if len(lines) == header_index + 1:
+                lines.pop()  # No preference matched; drop the section header
         
         # Active tasks section
         active_tasks = context.get('tasks', [])
         if active_tasks:
-            task_instructions = ["• ACTIVE TASKS to reference or continue:"]
+            lines.append("• ACTIVE TASKS to reference or continue:")
             for task in active_tasks[:3]:
                 status = task.get('status', 'unknown')
                 name = task.get('task_name', 'Unnamed task')
@@ -90,16 +158,19 @@ BEHAVIORAL ADAPTATION GUIDELINES:""")
                 priority = task.get('priority', 1)
                 
                 priority_indicator = "🔥" if priority >= 3 else "⭐" if priority >= 2 else "📋"
-                task_instructions.append(f"  {priority_indicator} {name} ({status}) - {desc}")
+                line = f"  {priority_indicator} {name} ({status}) - {desc}"
+                if len(line) > budget:
+                    break
+                budget -= len(line)
+                lines.append(line)
             
-            task_instructions.append("  - Reference these tasks when providing related assistance")
-            task_instructions.append("  - Offer to continue or update task progress when appropriate")
-            prompt_sections.append("\n".join(task_instructions))
+            lines.append("  - Reference these tasks when providing related assistance")
+            lines.append("  - Offer to continue or update task progress when appropriate")
         
         # Important memories section
         memories = context.get('memories', {})
         if memories:
-            memory_instructions = ["• IMPORTANT CONTEXT to acknowledge:"]
+            lines.append("• IMPORTANT CONTEXT to acknowledge:")
             
             # Important facts
             important_facts = memories.get('important_facts', [])[:2]
@@ -108,24 +179,26 @@ BEHAVIORAL ADAPTATION GUIDELINES:""")
                     content = fact['content'][:100]  # Truncate long facts
                     importance = fact.get('importance', 1)
                     indicator = "🔥" if importance >= 3 else "💡"
-                    memory_instructions.append(f"  {indicator} {content}")
+                    line = f"  {indicator} {content}"
+                    if len(line) > budget:
+                        break
+                    budget -= len(line)
+                    lines.append(line)
             
             # User patterns
             patterns = memories.get('patterns', [])[:2]
             if patterns:
-                memory_instructions.append("  📊 Observed patterns:")
+                lines.append("  📊 Observed patterns:")
                 for pattern in patterns:
-                    memory_instructions.append(f"    - {pattern['content'][:80]}")
+                    lines.append(f"    - {pattern['content'][:80]}")
             
             # Successful interactions
             successful = memories.get('successful_interactions', [])[:1]
             if successful:
-                memory_instructions.append(f"  ✅ Previous success: {successful[0]['content'][:60]}")
-            
-            prompt_sections.append("\n".join(memory_instructions))
+                lines.append(f"  ✅ Previous success: {successful[0]['content'][:60]}")
         
         # Response guidelines
-        prompt_sections.append("""
+        lines.append("""
 RESPONSE GUIDELINES:
 • Be brief and concise - use only the needed text to convey the matter precisely
 • Do not hallucinate or invent - only state things you are certain to be true
@@ -137,11 +210,11 @@ RESPONSE GUIDELINES:
 
 Remember: Use this context to provide more helpful, personalized responses while maintaining natural conversation flow.""")
         
-        return "\n".join(prompt_sections)
+        return "\n".join(lines)
     
     def chat_completion(self, messages, model="zai-glm-4.7", stream=True, 
                        max_completion_tokens=40000, temperature=0.7, top_p=0.8,
-                       use_enhanced_context=True):
+                       use_enhanced_context=True, use_cache=False):
         """
         Create a chat completion with the Cerebras API
         
@@ -153,6 +226,8 @@ Remember: Use this context to provide more helpful, personalized responses while
             temperature: Sampling temperature
             top_p: Top-p sampling parameter
             use_enhanced_context: Whether to enhance with database context
+            use_cache: Whether to answer an identical earlier request from the response cache
+                (opt-in: a sampled request replayed from cache never produces a new answer)
             
         Returns:
             Generator for streaming or completion object for non-streaming
@@ -161,16 +236,33 @@ Remember: Use this context to provide more helpful, personalized responses while
         if use_enhanced_context:
             messages = self.get_enhanced_context(messages)
         
-        # Store decision context if database is available
+        cache_key = None
+        cached_text = None
+        if use_cache:
+            cache_key = self._response_cache_key(
+                messages, model=model, max_completion_tokens=max_completion_tokens,
+                temperature=temperature, top_p=top_p
+            )
+            cached_text = self._response_cache.get(cache_key)
+        
+        # Buffer decision context; it is written after the response, off the request latency path
         if self.agent_db and self.current_conversation_id:
             decision_context = f"Model: {model}, Temperature: {temperature}, Messages: {len(messages)}"
-            self.agent_db.track_agent_decision(
+            self._decision_buffer.append((
                 self.current_conversation_id,
                 decision_context,
-                "chat_completion_request"
-            )
+                "chat_completion_cache_hit" if cached_text is not None else "chat_completion_request",
+                datetime.now(timezone.utc)
+            ))
+        
+        if cached_text is not None:
+            self._response_cache.move_to_end(cache_key)
+            if stream:
+                return self._cached_stream(cached_text)
+            self.flush_decisions()
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=cached_text))])
         
-        return self.client.chat.completions.create(
+        response = self.client.chat.completions.create(
             messages=messages,
             model=model,
             stream=stream,
@@ -178,36 +270,97 @@ Remember: Use this context to provide more helpful, personalized responses while
             temperature=temperature,
             top_p=top_p
         )
+        
+        # Streams flush once fully consumed; non-streaming responses are already complete
+        if not stream:
+            self.flush_decisions()
+            if cache_key is not None:
+                self._cache_response(cache_key, response.choices[0].message.content or "")
+        elif cache_key is not None:
+            response = self._recording_stream(response, cache_key)
+        
+        return response
+    
+    def _response_cache_key(self, messages: List[Dict], **params) -> str:
+        """Hash the final message list and sampling parameters into a cache key"""
+        payload = orjson.dumps({'messages': messages, **params}, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    def _cache_response(self, cache_key: str, text: str):
+        """Store a completed response, evicting the least recently used beyond RESPONSE_CACHE_SIZE"""
+        self._response_cache[cache_key] = text
+        self._response_cache.move_to_end(cache_key)
+        while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    def _recording_stream(self, stream, cache_key: str):
+        """Pass stream chunks through and cache the text once the stream completes"""
+        parts = []
+        for chunk in stream:
+            content = chunk.choices[0].delta.content
+            if content:
+                parts.append(content)
+            yield chunk
+        # Only reached when fully consumed, so interrupted responses are never cached
+        self._cache_response(cache_key, "".join(parts))
+    
+    def _cached_stream(self, text: str):
+        """Replay a cached response as a single chunk shaped like an SDK stream chunk"""
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+    
+    def flush_decisions(self):
+        """Write all buffered agent decisions in a single transaction"""
+        if self.agent_db and self._decision_buffer:
+            decisions, self._decision_buffer = self._decision_buffer, []
+            self.agent_db.track_agent_decisions_bulk(decisions)
+    
+    def flush_metrics(self):
+        """Write all buffered response_metrics memories in a single transaction"""
+        if self.agent_db and self._metrics_buffer:
+            rows, self._metrics_buffer = self._metrics_buffer, []
+            self.agent_db.store_memories_bulk(rows)
+    
+    def close(self):
+        """Write every buffered decision and metrics row (also run when the AgentDB closes)"""
+        self.flush_decisions()
+        self.flush_metrics()
     
     def chat_stream_to_text(self, stream):
         """Convert streaming response to full text"""
-        full_response = ""
+        # Collect chunks and join once; repeated += can degrade to quadratic copying
+        parts = []
         for chunk in stream:
-            content = chunk.choices[0].delta.content or ""
-            full_response += content
+            content = chunk.choices[0].delta.content
+            if content:
+                parts.append(content)
+        full_response = "".join(parts)
         
-        # Store response metrics if database available
+        # Buffer response metrics if database available; rows are written in batches
         if self.agent_db and self.current_conversation_id and full_response:
-            self.agent_db.store_memory(
+            self._metrics_buffer.append((
                 self.current_conversation_id,
                 'response_metrics',
-                json.dumps({
+                orjson.dumps({
                     'response_length': len(full_response),
                     'word_count': len(full_response.split()),
                     'has_code': '```' in full_response
-                }),
-                importance=1
-            )
+                }).decode(),
+                1
+            ))
+            if len(self._metrics_buffer) >= self.METRICS_FLUSH_EVERY:
+                self.flush_metrics()
         
+        self.flush_decisions()
         return full_response
     
     def chat_stream_generator(self, stream, store_chunks=False):
         """Generator that yields each chunk of streaming response"""
-        full_response = ""
+        # Only the length is needed afterwards, so accumulate that instead of the text
+        response_length = 0
         for chunk in stream:
             content = chunk.choices[0].delta.content or ""
             if content:
-                full_response += content
+                response_length += len(content)
                 yield content
         
         # Store final response context if requested
@@ -215,9 +368,11 @@ Remember: Use this context to provide more helpful, personalized responses while
             self.agent_db.store_memory(
                 self.current_conversation_id,
                 'response_patterns',
-                f"Response length: {len(full_response)} chars",
+                f"Response length: {response_length} chars",
                 importance=1
             )
+        
+        self.flush_decisions()
     
     def analyze_user_pattern(self, user_message: str):
         """Analyze user message for patterns and preferences"""
@@ -225,22 +380,27 @@ Remember: Use this context to provide more helpful, personalized responses while
             return
         
         # Simple pattern detection - could be enhanced with NLP
+        keywords = {match.lower() for match in _PATTERN_KEYWORD_RE.findall(user_message)}
         patterns = {
-            'prefers_code': any(word in user_message.lower() for word in ['code', 'function', 'class', 'method']),
+            'prefers_code': not _CODE_KEYWORDS.isdisjoint(keywords),
             'asks_questions': user_message.strip().endswith('?'),
-            'requests_explanation': any(word in user_message.lower() for word in ['explain', 'how', 'why', 'what']),
+            'requests_explanation': not _EXPLANATION_KEYWORDS.isdisjoint(keywords),
             'message_length': len(user_message)
         }
         
-        # Store patterns as preferences
+        # Compute every updated counter from a single preferences read
+        preferences = self.agent_db.get_user_preferences(self.current_conversation_id)
+        updates = {}
         for pattern, detected in patterns.items():
             if detected and pattern != 'message_length':
-                current_count = self.agent_db.get_user_preference(self.current_conversation_id, f'{pattern}_count', 0)
-                self.agent_db.store_user_preference(self.current_conversation_id, f'{pattern}_count', current_count + 1)
+                updates[f'{pattern}_count'] = preferences.get(f'{pattern}_count', 0) + 1
         
-        # Store average message length
-        avg_length = self.agent_db.get_user_preference(self.current_conversation_id, 'avg_message_length', 0)
-        msg_count = self.agent_db.get_user_preference(self.current_conversation_id, 'message_count', 0)
+        # Update average message length
+        avg_length = preferences.get('avg_message_length', 0)
+        msg_count = preferences.get('message_count', 0)
         new_avg = (avg_length * msg_count + patterns['message_length']) / (msg_count + 1)
-        self.agent_db.store_user_preference(self.current_conversation_id, 'avg_message_length', int(new_avg))
-        self.agent_db.store_user_preference(self.current_conversation_id, 'message_count', msg_count + 1)
+        updates['avg_message_length'] = int(new_avg)
+        updates['message_count'] = msg_count + 1
+        
+        # One multi-row UPSERT per turn
+        self.agent_db.store_user_preferences(self.current_conversation_id, updates)
\ No newline at end of file
@@ -1,7 +1,42 @@
+import atexit
+import time
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
 from cerebras_client import CerebrasClient
 from agent_db import AgentDB, AgentMemoryManager
 
+# Minimum seconds between UI updates while streaming; chunks arriving in between are coalesced
+STREAM_UPDATE_INTERVAL = 0.05
+
+# Most recent [user, bot] pairs sent to the model verbatim each turn
+MAX_HISTORY_TURNS = 20
+
+# Older turns are compressed into a system note of their user messages, newest first, within these limits
+EARLIER_TURN_SNIPPET_CHARS = 120
+EARLIER_TURNS_CHAR_BUDGET = 1500
+
+def summarize_earlier_turns(turns) -> str:
+    """Compress [user, bot] pairs that fell out of the history window into a short system note"""
+    snippets = []
+    budget = EARLIER_TURNS_CHAR_BUDGET
+    for user_msg, _ in reversed(turns):
+        snippet = " ".join(str(user_msg).split())
+        if len(snippet) > EARLIER_TURN_SNIPPET_CHARS:
+            snippet = snippet[:EARLIER_TURN_SNIPPET_CHARS] + "..."
+        if len(snippet) > budget:
+            break
+        budget -= len(snippet)
+        snippets.append(f"- {snippet}")
+    
+    if not snippets:
+        return ""
+    
+    snippets.reverse()
+    return "\n".join([
+        f"Summary of {len(turns)} earlier turns no longer shown in full; the user previously asked:",
+        *snippets
+    ])
+
 def create_chat_interface():
     """Create and configure the Gradio chat interface"""
     
@@ -18,6 +53,35 @@ def create_chat_interface():
     # Current conversation state
     current_conversation_id = None
     
+    # One worker keeps background writes serialized on the shared connection
+    db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-db-writer")
+    pending_write = None
+    
+    def shutdown():
+        """Finish background writes, then close the database (which flushes the client's buffered rows)"""
+        db_writer.shutdown(wait=True)
+        agent_db.close()
+    
+    atexit.register(shutdown)
+    
+    def record_response(conversation_id, message, response):
+        """Store the assistant turn and its bookkeeping in a single commit"""
+        with agent_db.transaction():
+            # Save complete bot response to database
+            agent_db.add_message(conversation_id, "assistant", response)
+            
+            # Store interaction summary for learning
+            if len(response) > 100:  # Substantial response
+                agent_db.store_memory(
+                    conversation_id,
+                    'successful_interactions',
+                    f"User: {message[:50]}... | Response: {len(response)} chars",
+                    importance=2
+                )
+            
+            # Summarize conversation if getting long
+            agent_db.summarize_conversation(conversation_id)
+    
     def chat_function(message, history):
         """
         Handle chat messages from Gradio interface with streaming
@@ -29,37 +93,49 @@ def create_chat_interface():
         Yields:
             String chunks of the streaming response
         """
-        nonlocal current_conversation_id
+        nonlocal current_conversation_id, pending_write
         
         try:
-            # Create new conversation if none exists
-            if current_conversation_id is None:
-                # Generate title from first message (truncated)
-                title = message[:50] + "..." if len(message) > 50 else message
-                current_conversation_id = agent_db.create_conversation(title)
+            # The previous turn must be stored before this turn reads or writes
+            if pending_write is not None:
+                previous_write, pending_write = pending_write, None
+                previous_write.result()  # Re-raises a failed write so it is reported once
+            
+            # Pre-response bookkeeping commits once instead of once per statement
+            with agent_db.transaction():
+                # Create new conversation if none exists
+                if current_conversation_id is None:
+                    # Generate title from first message (truncated)
+                    title = message[:50] + "..." if len(message) > 50 else message
+                    current_conversation_id = agent_db.create_conversation(title)
+                    
+                    # Set conversation context in Cerebras client
+                    cerebras.set_conversation_context(current_conversation_id)
+                    
+                    # Initialize session
+                    session_data = {
+                        'started_at': history,
+                        'user_agent': 'gradio_chat',
+                        'initial_message': message[:100]
+                    }
+                    agent_db.create_session(current_conversation_id, session_data)
                 
-                # Set conversation context in Cerebras client
-                cerebras.set_conversation_context(current_conversation_id)
+                # Analyze user message patterns
+                cerebras.analyze_user_pattern(message)
                 
-                # Initialize session
-                session_data = {
-                    'started_at': history,
-                    'user_agent': 'gradio_chat',
-                    'initial_message': message[:100]
-                }
-                agent_db.create_session(current_conversation_id, session_data)
-            
-            # Analyze user message patterns
-            cerebras.analyze_user_pattern(message)
-            
-            # Save user message to database
-            agent_db.add_message(current_conversation_id, "user", message)
+                # Save user message to database
+                agent_db.add_message(current_conversation_id, "user", message)
             
             # Convert Gradio history format to Cerebras messages format
             messages = []
             
-            # Add conversation history
-            for user_msg, bot_msg in history:
+            # Turns outside the window are carried as a compressed summary instead of verbatim
+            earlier_summary = summarize_earlier_turns(history[:-MAX_HISTORY_TURNS])
+            if earlier_summary:
+                messages.append({"role": "system", "content": earlier_summary})
+            
+            # Add recent conversation history (a bounded window keeps input tokens per turn flat)
+            for user_msg, bot_msg in history[-MAX_HISTORY_TURNS:]:
                 messages.append({"role": "user", "content": user_msg})
                 if bot_msg:  # bot_msg might be None if conversation was interrupted
                     messages.append({"role": "assistant", "content": bot_msg})
@@ -67,29 +143,26 @@ def create_chat_interface():
             # Add current message
             messages.append({"role": "user", "content": message})
             
-            # Get streaming response
-            stream = cerebras.chat_completion(messages=messages, stream=True)
+            # Get streaming response (uncached, so Retry/regenerate samples a fresh answer)
+            stream = cerebras.chat_completion(messages=messages, stream=True, use_cache=False)
             
-            # Yield chunks for real-time streaming
-            partial_response = ""
+            # ChatInterface re-renders the whole message per yield, so coalesce chunks into
+            # fewer updates instead of re-sending the growing text for every token
+            parts = []
+            last_update = 0.0
             for chunk in cerebras.chat_stream_generator(stream):
-                partial_response += chunk
-                yield partial_response
-            
-            # Save complete bot response to database
-            agent_db.add_message(current_conversation_id, "assistant", partial_response)
-            
-            # Store interaction summary for learning
-            if len(partial_response) > 100:  # Substantial response
-                agent_db.store_memory(
-                    current_conversation_id,
-                    'successful_interactions',
-                    f"User: {message[:50]}... | Response: {len(partial_response)} chars",
-                    importance=2
-                )
+                parts.append(chunk)
+                now = time.monotonic()
+                if now - last_update >= STREAM_UPDATE_INTERVAL:
+                    last_update = now
+                    yield "".join(parts)
+            partial_response = "".join(parts)
+            yield partial_response
             
-            # Summarize conversation if getting long
-            agent_db.summarize_conversation(current_conversation_id)
+            # Post-response bookkeeping runs in the background so the request completes now
+            pending_write = db_writer.submit(
+                record_response, current_conversation_id, message, partial_response
+            )
             
         except Exception as e:
             error_msg = f"Error: {str(e)}"
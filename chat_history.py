@@ -1,16 +1,48 @@
 import apsw
-import json
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import uuid
 
 class ChatHistory:
+    # Size of apsw's per-connection prepared statement LRU (keyed on exact SQL text)
+    STATEMENT_CACHE_SIZE = 100
+    
+    # Memory-mapped I/O window in bytes and page cache size (negative = KiB)
+    MMAP_SIZE = 268435456  # 256 MiB
+    CACHE_SIZE = -20000    # ~20 MB
+    
+    # Hot-path SQL kept as constants so every call hits the same cached prepared statement
+    _SQL_INSERT_MESSAGE = '''
+        INSERT INTO messages (conversation_id, role, content) 
+        VALUES (?, ?, ?)
+    '''
+    _SQL_TOUCH_CONVERSATION = '''
+        UPDATE conversations 
+        SET updated_at = CURRENT_TIMESTAMP 
+        WHERE id = ?
+    '''
+    
     def __init__(self, db_path: str = "chat_history.db"):
         """Initialize chat history with APSW SQLite database"""
         self.db_path = db_path
-        self.connection = apsw.Connection(db_path)
+        self.connection = apsw.Connection(db_path, statementcachesize=self.STATEMENT_CACHE_SIZE)
+        self.configure_connection()
         self.init_database()
     
+    def configure_connection(self):
+        """Apply WAL journaling and PRAGMA tuning before any table is touched"""
+        cursor = self.connection.cursor()
+        
+        # WAL lets readers proceed during writes; NORMAL sync skips the per-commit fsync
+        self.journal_mode = cursor.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute(f'PRAGMA mmap_size={int(self.MMAP_SIZE)}')
+        cursor.execute(f'PRAGMA cache_size={int(self.CACHE_SIZE)}')
+        cursor.execute('PRAGMA wal_autocheckpoint=1000')  # Pages; keeps the WAL file bounded
+        cursor.execute('PRAGMA busy_timeout=3000')
+    
     def init_database(self):
         """Create tables if they don't exist"""
         cursor = self.connection.cursor()
@@ -39,6 +71,70 @@ class ChatHistory:
             CREATE INDEX IF NOT EXISTS idx_messages_conversation 
             ON messages(conversation_id, timestamp)
         ''')
+        
+        # Serves the most-recent-first listings without a sort
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated 
+            ON conversations(updated_at DESC)
+        ''')
+        
+        # Full-text index over message content, kept in sync with messages by triggers.
+        # The trigram tokenizer matches arbitrary substrings case-insensitively, like LIKE '%q%'.
+        has_fts_table = cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()[0]
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content,
+                conversation_id UNINDEXED,
+                content='messages',
+                content_rowid='id',
+                tokenize='trigram'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, content, conversation_id)
+                VALUES (new.id, new.content, new.conversation_id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+                VALUES ('delete', old.id, old.content, old.conversation_id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+                VALUES ('delete', old.id, old.content, old.conversation_id);
+                INSERT INTO messages_fts (rowid, content, conversation_id)
+                VALUES (new.id, new.content, new.conversation_id);
+            END
+        ''')
+        if not has_fts_table:
+            # Index messages written before the full-text table existed
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    
+    @contextmanager
+    def transaction(self):
+        """Group several writes into one IMMEDIATE transaction (one commit instead of one per statement).
+        
+        Nested use joins the enclosing transaction, which commits or rolls back everything.
+        """
+        cursor = self.connection.cursor()
+        if self.connection.in_transaction:
+            yield cursor
+            return
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        else:
+            cursor.execute('COMMIT')
     
     def create_conversation(self, title: str = None) -> str:
         """Create a new conversation and return its ID"""
@@ -56,66 +152,64 @@ class ChatHistory:
     def add_message(self, conversation_id: str, role: str, content: str):
         """Add a message to a conversation"""
         cursor = self.connection.cursor()
-        cursor.execute('''
-            INSERT INTO messages (conversation_id, role, content) 
-            VALUES (?, ?, ?)
-        ''', (conversation_id, role, content))
+        cursor.execute(self._SQL_INSERT_MESSAGE, (conversation_id, role, content))
         
         # Update conversation timestamp
-        cursor.execute('''
-            UPDATE conversations 
-            SET updated_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        ''', (conversation_id,))
+        cursor.execute(self._SQL_TOUCH_CONVERSATION, (conversation_id,))
+    
+    def add_messages_bulk(self, rows: List[Tuple[str, str, str]]):
+        """Add many (conversation_id, role, content) messages in one transaction"""
+        with self.transaction() as cursor:
+            cursor.executemany(self._SQL_INSERT_MESSAGE, rows)
+            cursor.executemany(
+                self._SQL_TOUCH_CONVERSATION,
+                [(conversation_id,) for conversation_id in dict.fromkeys(row[0] for row in rows)]
+            )
     
     def get_conversation_messages(self, conversation_id: str) -> List[Tuple[str, str]]:
         """Get all messages from a conversation in Gradio format [(user_msg, bot_msg)]"""
         cursor = self.connection.cursor()
-        messages = list(cursor.execute('''
-            SELECT role, content FROM messages 
-            WHERE conversation_id = ? 
-            ORDER BY timestamp ASC
-        ''', (conversation_id,)))
         
-        # Convert to Gradio format: [(user_message, bot_response), ...]
+        # Convert to Gradio format in one pass over the cursor: [(user_message, bot_response), ...]
         history = []
-        current_pair = [None, None]  # [user_msg, bot_msg]
+        pending_user = None
         
-        for role, content in messages:
+        for role, content in cursor.execute('''
+            SELECT role, content FROM messages 
+            WHERE conversation_id = ? 
+            ORDER BY timestamp ASC, id ASC
+        ''', (conversation_id,)):
             if role == "user":
-                if current_pair[0] is not None:
-                    # Save previous pair if it exists
-                    history.append(tuple(current_pair))
-                current_pair = [content, None]
+                if pending_user is not None:
+                    # Previous user message never got a response
+                    history.append((pending_user, None))
+                pending_user = content
             elif role == "assistant":
-                current_pair[1] = content
-                history.append(tuple(current_pair))
-                current_pair = [None, None]
+                history.append((pending_user, content))
+                pending_user = None
         
         # Handle case where last message is from user (no response yet)
-        if current_pair[0] is not None and current_pair[1] is None:
-            history.append((current_pair[0], None))
+        if pending_user is not None:
+            history.append((pending_user, None))
         
         return history
     
     def get_conversations(self) -> List[Dict]:
         """Get all conversations ordered by most recent"""
         cursor = self.connection.cursor()
-        conversations = []
-        
-        for row in cursor.execute('''
+        return self._conversation_dicts(cursor.execute('''
             SELECT id, title, created_at, updated_at 
             FROM conversations 
             ORDER BY updated_at DESC
-        '''):
-            conversations.append({
-                'id': row[0],
-                'title': row[1],
-                'created_at': row[2],
-                'updated_at': row[3]
-            })
-        
-        return conversations
+        '''))
+    
+    @staticmethod
+    def _conversation_dicts(rows) -> List[Dict]:
+        """Build conversation dicts from (id, title, created_at, updated_at) rows in one comprehension"""
+        return [
+            {'id': id_, 'title': title, 'created_at': created_at, 'updated_at': updated_at}
+            for id_, title, created_at, updated_at in rows
+        ]
     
     def delete_conversation(self, conversation_id: str):
         """Delete a conversation and all its messages"""
@@ -135,50 +229,56 @@ class ChatHistory:
     def search_conversations(self, query: str) -> List[Dict]:
         """Search conversations by title or message content"""
         cursor = self.connection.cursor()
-        conversations = []
-        
-        for row in cursor.execute('''
-            SELECT DISTINCT c.id, c.title, c.created_at, c.updated_at
-            FROM conversations c
-            LEFT JOIN messages m ON c.id = m.conversation_id
-            WHERE c.title LIKE ? OR m.content LIKE ?
-            ORDER BY c.updated_at DESC
-        ''', (f'%{query}%', f'%{query}%')):
-            conversations.append({
-                'id': row[0],
-                'title': row[1],
-                'created_at': row[2],
-                'updated_at': row[3]
-            })
-        
-        return conversations
+        
+        if len(query) >= 3:
+            # Quoted as one phrase so the query text is never parsed as FTS5 syntax
+            rows = cursor.execute('''
+                SELECT c.id, c.title, c.created_at, c.updated_at
+                FROM conversations c
+                WHERE c.title LIKE ? OR c.id IN (
+                    SELECT conversation_id FROM messages_fts WHERE messages_fts MATCH ?
+                )
+                ORDER BY c.updated_at DESC
+            ''', (f'%{query}%', '"' + query.replace('"', '""') + '"'))
+        else:
+            # Trigrams need at least three characters; short queries fall back to a scan
+            rows = cursor.execute('''
+                SELECT c.id, c.title, c.created_at, c.updated_at
+                FROM conversations c
+                WHERE c.title LIKE ? OR c.id IN (
+                    SELECT conversation_id FROM messages WHERE content LIKE ?
+                )
+                ORDER BY c.updated_at DESC
+            ''', (f'%{query}%', f'%{query}%'))
+        
+        return self._conversation_dicts(rows)
     
     def get_conversation_stats(self) -> Dict:
         """Get statistics about conversations"""
         cursor = self.connection.cursor()
         
         # Total conversations
-        total_conversations = list(cursor.execute(
+        total_conversations = cursor.execute(
             'SELECT COUNT(*) FROM conversations'
-        ))[0][0]
+        ).fetchone()[0]
         
         # Total messages
-        total_messages = list(cursor.execute(
+        total_messages = cursor.execute(
             'SELECT COUNT(*) FROM messages'
-        ))[0][0]
+        ).fetchone()[0]
         
         # Most recent conversation
-        recent = list(cursor.execute('''
+        recent = cursor.execute('''
             SELECT title, updated_at FROM conversations 
             ORDER BY updated_at DESC LIMIT 1
-        '''))
+        ''').fetchone()
         
         return {
             'total_conversations': total_conversations,
             'total_messages': total_messages,
             'most_recent': {
-                'title': recent[0][0] if recent else None,
-                'updated_at': recent[0][1] if recent else None
+                'title': recent[0] if recent else None,
+                'updated_at': recent[1] if recent else None
             }
         }
     
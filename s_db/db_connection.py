@@ -0,0 +1,33 @@
+# db_connection.py
+# Shares one APSW connection per database file across the s_db helpers.
+import apsw
+
+# Open connections keyed by db_path
+_conn_cache = {}
+
+# Prepared statements kept per connection (keyed on exact SQL text)
+STATEMENT_CACHE_SIZE = 200
+
+def get_connection(db_path):
+    """
+    Returns the cached connection for db_path, opening it on first use.
+    Opening a connection costs far more than the small queries these helpers run.
+    """
+    conn = _conn_cache.get(db_path)
+    if conn is None:
+        conn = apsw.Connection(db_path, statementcachesize=STATEMENT_CACHE_SIZE)
+        cursor = conn.cursor()
+        # One PRAGMA per call: a multi-statement execute pauses at journal_mode's result row
+        cursor.execute("PRAGMA journal_mode=WAL").fetchall()
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        _conn_cache[db_path] = conn
+    return conn
+
+def close_all():
+    """
+    Closes every cached connection (call before deleting a database file).
+    """
+    for conn in _conn_cache.values():
+        conn.close()
+    _conn_cache.clear()
@@ -1,7 +1,7 @@
 # db_explorer.py
 
-import apsw
-import json
+from db_connection import get_connection
+import orjson
 
 # -----------------------------
 # 1. Show Full Conversation History
@@ -11,8 +11,7 @@ def show_full_history(db_path, conversation_id):
     Displays the entire conversation log (user + assistant) in order.
     Useful for reviewing how goals and responses evolved.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
         SELECT role, content, timestamp 
         FROM messages 
@@ -33,8 +32,7 @@ def summarize_roles(db_path, conversation_id):
     Counts how many messages were sent by 'user' vs 'assistant'.
     Helps audit interaction balance.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
         SELECT role, COUNT(*) 
         FROM messages 
@@ -55,13 +53,22 @@ def search_keyword(db_path, keyword):
     Finds all messages containing a keyword.
     Useful for tracking how tools or terms were used.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT conversation_id, role, content, timestamp 
-        FROM messages 
-        WHERE content LIKE ?
-    """, (f"%{keyword}%",))
+    cursor = get_connection(db_path).cursor()
+    if len(keyword) >= 3:
+        # Full-text lookup; the keyword is quoted as one phrase so it is never parsed as FTS syntax
+        cursor.execute("""
+            SELECT m.conversation_id, m.role, m.content, m.timestamp 
+            FROM messages_fts 
+            JOIN messages m ON m.id = messages_fts.rowid 
+            WHERE messages_fts MATCH ?
+        """, ('"' + keyword.replace('"', '""') + '"',))
+    else:
+        # Trigrams need at least three characters; short keywords fall back to a scan
+        cursor.execute("""
+            SELECT conversation_id, role, content, timestamp 
+            FROM messages 
+            WHERE content LIKE ?
+        """, (f"%{keyword}%",))
     results = cursor.fetchall()
     print(f"\n[Keyword Search] for '{keyword}':")
     for conv_id, role, content, ts in results:
@@ -73,26 +80,27 @@ def search_keyword(db_path, keyword):
 # -----------------------------
 def extract_task_plans(db_path):
     """
-    Retrieves all stored task plans (JSON blobs from assistant).
+    Retrieves all stored task plans from the task_plans table.
     Helps analyze how goals are being decomposed over time.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
-        SELECT conversation_id, content, timestamp
-        FROM messages
-        WHERE role = 'assistant' AND content LIKE '[%'
-        ORDER BY timestamp
+        SELECT conversation_id, plan_json, created_at
+        FROM task_plans
+        ORDER BY created_at, id
     """)
-    plans = cursor.fetchall()
+    plans = []
     print("\n[Task Plans] found in DB:")
-    for conv_id, content, ts in plans:
+    # Stream rows off the cursor instead of fetching them all before printing
+    for row in cursor:
+        plans.append(row)
+        conv_id, content, ts = row
         print(f"\n--- Plan in '{conv_id}' at {ts} ---")
         try:
-            task_list = json.loads(content)
+            task_list = orjson.loads(content)
             for task in task_list:
                 print(f"  [{task['id']}] {task['description']} → {task['status']}")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print("  (Invalid JSON content)")
     return plans
 
@@ -104,12 +112,11 @@ def get_last_user_goal(db_path, conversation_id):
     Gets the last message sent by the user in a conversation.
     Useful for context-aware task regeneration.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
         SELECT content FROM messages
         WHERE conversation_id = ? AND role = 'user'
-        ORDER BY timestamp DESC LIMIT 1
+        ORDER BY timestamp DESC, id DESC LIMIT 1
     """, (conversation_id,))
     result = cursor.fetchone()
     if result:
@@ -126,8 +133,7 @@ def list_titles(db_path):
     """
     Lists all conversation titles for quick browsing.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("SELECT id, title, created_at FROM conversations")
     results = cursor.fetchall()
     print("\n[Conversation Titles]:")
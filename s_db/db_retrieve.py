@@ -1,19 +1,22 @@
 # db_retrieve.py
 
-import apsw
+from db_connection import get_connection
+import logging
+
+logger = logging.getLogger(__name__)
 
 def list_conversations(db_path):
     """
     Lists all conversations in the database.
     Returns a list of tuples: (id, title, created_at)
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("SELECT id, title, created_at FROM conversations")
     results = cursor.fetchall()
-    print("[DB] Conversations listed:")
-    for row in results:
-        print(f"  - {row[1]} (ID: {row[0]}, Created: {row[2]})")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[DB] Conversations listed:")
+        for row in results:
+            logger.debug("  - %s (ID: %s, Created: %s)", row[1], row[0], row[2])
     return results
 
 def read_conversation(db_path, conversation_id):
@@ -21,8 +24,7 @@ def read_conversation(db_path, conversation_id):
     Reads all messages in a given conversation.
     Returns a list of tuples: (role, content, timestamp)
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
         SELECT role, content, timestamp 
         FROM messages 
@@ -30,25 +32,59 @@ def read_conversation(db_path, conversation_id):
         ORDER BY timestamp
     """, (conversation_id,))
     results = cursor.fetchall()
-    print(f"[DB] Messages in conversation {conversation_id}:")
-    for row in results:
-        print(f"  [{row[0]}] ({row[2]}): {row[1]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[DB] Messages in conversation %s:", conversation_id)
+        for row in results:
+            logger.debug("  [%s] (%s): %s", row[0], row[2], row[1])
     return results
 
+def read_conversation_columnar(db_path, conversation_id):
+    """
+    Reads all messages in a given conversation column by column.
+    Returns a dict of parallel lists: {"role": [...], "content": [...], "timestamp": [...]}
+    Rows are streamed off the cursor, so no per-row tuple list is kept.
+    """
+    cursor = get_connection(db_path).cursor()
+    cursor.execute("""
+        SELECT role, content, timestamp 
+        FROM messages 
+        WHERE conversation_id = ? 
+        ORDER BY timestamp
+    """, (conversation_id,))
+    roles, contents, timestamps = [], [], []
+    add_role, add_content, add_timestamp = roles.append, contents.append, timestamps.append
+    for role, content, timestamp in cursor:
+        add_role(role)
+        add_content(content)
+        add_timestamp(timestamp)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[DB] Read %d messages in conversation %s", len(roles), conversation_id)
+    return {"role": roles, "content": contents, "timestamp": timestamps}
+
 def search_messages(db_path, keyword):
     """
     Searches all messages for a keyword.
     Returns a list of matching messages.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT conversation_id, role, content, timestamp 
-        FROM messages 
-        WHERE content LIKE ?
-    """, (f"%{keyword}%",))
+    cursor = get_connection(db_path).cursor()
+    if len(keyword) >= 3:
+        # Full-text lookup; the keyword is quoted as one phrase so it is never parsed as FTS syntax
+        cursor.execute("""
+            SELECT m.conversation_id, m.role, m.content, m.timestamp 
+            FROM messages_fts 
+            JOIN messages m ON m.id = messages_fts.rowid 
+            WHERE messages_fts MATCH ?
+        """, ('"' + keyword.replace('"', '""') + '"',))
+    else:
+        # Trigrams need at least three characters; short keywords fall back to a scan
+        cursor.execute("""
+            SELECT conversation_id, role, content, timestamp 
+            FROM messages 
+            WHERE content LIKE ?
+        """, (f"%{keyword}%",))
     results = cursor.fetchall()
-    print(f"[DB] Messages matching '{keyword}':")
-    for row in results:
-        print(f"  [{row[1]}] ({row[3]}) in {row[0]}: {row[2][:60]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[DB] Messages matching '%s':", keyword)
+        for row in results:
+            logger.debug("  [%s] (%s) in %s: %s...", row[1], row[3], row[0], row[2][:60])
     return results
\ No newline at end of file
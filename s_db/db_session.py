@@ -1,43 +1,62 @@
 # db_session.py
 # Tracks current session tasks and statuses.
-import apsw
-import json
+from db_connection import get_connection
+import orjson
+import logging
+
+logger = logging.getLogger(__name__)
 
 def store_task_plan(db_path, conversation_id, task_list):
     """
-    Stores the task plan as a message in the DB under the assistant's role.
+    Stores the task plan as a new row in the 'task_plans' table.
     task_list is a list of task dictionaries.
     """
-    task_json = json.dumps(task_list, indent=2)
-    store_message(db_path, conversation_id, "assistant", task_json)
+    cursor = get_connection(db_path).cursor()
+    cursor.execute("""
+        INSERT INTO task_plans (conversation_id, plan_json) 
+        VALUES (?, ?)
+    """, (conversation_id, orjson.dumps(task_list).decode()))
+    logger.debug("[DB] Task plan with %d tasks stored for %s", len(task_list), conversation_id)
 
 def load_task_plan(db_path, conversation_id):
     """
     Loads the most recent task plan for a conversation.
     Returns a list of task dictionaries.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
-        SELECT content FROM messages
-        WHERE conversation_id = ? AND role = 'assistant'
-        ORDER BY timestamp DESC LIMIT 1
+        SELECT plan_json FROM task_plans
+        WHERE conversation_id = ?
+        ORDER BY created_at DESC, id DESC LIMIT 1
     """, (conversation_id,))
     result = cursor.fetchone()
     if result:
-        return json.loads(result[0])
+        return orjson.loads(result[0])
     else:
-        print("[DB] No task plan found.")
+        logger.debug("[DB] No task plan found.")
         return []
 
 def update_task_status(db_path, conversation_id, task_id, new_status):
     """
     Updates the status of a specific task in the latest plan.
+    The plan row is edited in place with json_set; no new plan row is written.
     """
-    task_list = load_task_plan(db_path, conversation_id)
-    for task in task_list:
-        if task["id"] == task_id:
-            task["status"] = new_status
-            break
-    store_task_plan(db_path, conversation_id, task_list)
-    print(f"[DB] Task {task_id} updated to '{new_status}'")
\ No newline at end of file
+    conn = get_connection(db_path)
+    conn.cursor().execute("""
+        UPDATE task_plans
+        SET plan_json = json_set(
+            plan_json,
+            (SELECT fullkey FROM json_each(task_plans.plan_json) WHERE value ->> 'id' = ?1) || '.status',
+            ?2
+        )
+        WHERE id = (
+            SELECT id FROM task_plans
+            WHERE conversation_id = ?3
+            ORDER BY created_at DESC, id DESC LIMIT 1
+        )
+        AND EXISTS (SELECT 1 FROM json_each(task_plans.plan_json) WHERE value ->> 'id' = ?1)
+    """, (task_id, new_status, conversation_id))
+    if conn.changes():
+        logger.debug("[DB] Task %s updated to '%s'", task_id, new_status)
+    else:
+        logger.debug("[DB] Task %s not found in the latest plan.", task_id)
@@ -1,15 +1,18 @@
 # db_setup.py
 
-import apsw  # Use APSW for SQLite access
+from db_connection import get_connection
+import logging
 
-def setup_database(db_path):
+logger = logging.getLogger(__name__)
+
+def setup_database(db_path, mmap_size=268435456, cache_size=-65536):
     """
     Sets up the required tables in the SQLite database.
     If tables already exist, this function does nothing.
+    mmap_size (bytes) and cache_size (negative = KiB) tune the shared connection.
     """
-    # Open a connection to the SQLite database
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    # Reuse the shared connection to the SQLite database
+    cursor = get_connection(db_path).cursor()
 
     # Create the 'conversations' table if it doesn't exist
     cursor.execute("""
@@ -39,4 +42,85 @@ def setup_database(db_path):
         ON messages(conversation_id, timestamp)
     """)
 
-    print(f"[DB] Database schema ensured at {db_path}")
\ No newline at end of file
+    # Latest message of one role in a conversation (e.g. the last user goal);
+    # scanned backwards, the implicit rowid suffix also orders same-second ties by id
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_conv_role_ts 
+        ON messages(conversation_id, role, timestamp)
+    """)
+
+    # Task plans (JSON lists of task dicts) get their own table instead of living in messages
+    has_plan_table = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'task_plans'"
+    ).fetchone()[0]
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            plan_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+    """)
+
+    # Latest plan for a conversation; scanned backwards, the rowid suffix orders same-second ties
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_plans_conv_created 
+        ON task_plans(conversation_id, created_at)
+    """)
+    if not has_plan_table:
+        # Carry over plans stored as assistant messages by earlier versions
+        cursor.execute("""
+            INSERT INTO task_plans (conversation_id, plan_json, created_at)
+            SELECT conversation_id, content, timestamp
+            FROM messages
+            WHERE role = 'assistant' AND substr(content, 1, 1) = '[' AND json_valid(content)
+            ORDER BY timestamp, id
+        """)
+
+    # Full-text index over message content (same definition ChatHistory uses, so either may create it);
+    # the trigram tokenizer keeps LIKE '%kw%' substring semantics
+    has_fts_table = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+    ).fetchone()[0]
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            conversation_id UNINDEXED,
+            content='messages',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, conversation_id)
+            VALUES ('delete', old.id, old.content, old.conversation_id);
+            INSERT INTO messages_fts (rowid, content, conversation_id)
+            VALUES (new.id, new.content, new.conversation_id);
+        END
+    """)
+    if not has_fts_table:
+        # Index any messages written before the full-text table existed
+        cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+    # WAL with NORMAL sync avoids two fsyncs per insert; foreign_keys stays at its default (OFF)
+    cursor.execute("PRAGMA journal_mode=WAL").fetchall()
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}").fetchall()
+    cursor.execute(f"PRAGMA cache_size={int(cache_size)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+
+    logger.debug("[DB] Database schema ensured at %s", db_path)
\ No newline at end of file
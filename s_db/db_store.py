@@ -1,28 +1,43 @@
 # db_store.py
 
-import apsw
+from db_connection import get_connection
+import logging
 import time
 
+logger = logging.getLogger(__name__)
+
+# Shared by store_message and store_messages so both reuse one cached prepared statement
+_SQL_INSERT_MESSAGE = """
+    INSERT INTO messages (conversation_id, role, content) 
+    VALUES (?, ?, ?)
+"""
+
 def store_conversation(db_path, conversation_id, title):
     """
     Stores a new conversation entry in the 'conversations' table.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
+    cursor = get_connection(db_path).cursor()
     cursor.execute("""
         INSERT OR IGNORE INTO conversations (id, title) 
         VALUES (?, ?)
     """, (conversation_id, title))
-    print(f"[DB] Conversation '{title}' stored with ID: {conversation_id}")
+    logger.debug("[DB] Conversation '%s' stored with ID: %s", title, conversation_id)
 
 def store_message(db_path, conversation_id, role, content):
     """
     Stores a message (user or assistant) in the 'messages' table.
     """
-    conn = apsw.Connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO messages (conversation_id, role, content) 
-        VALUES (?, ?, ?)
-    """, (conversation_id, role, content))
-    print(f"[DB] Message stored: {role} -> {content[:50]}...")
\ No newline at end of file
+    cursor = get_connection(db_path).cursor()
+    cursor.execute(_SQL_INSERT_MESSAGE, (conversation_id, role, content))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[DB] Message stored: %s -> %s...", role, content[:50])
+
+def store_messages(db_path, rows):
+    """
+    Stores many (conversation_id, role, content) messages in one transaction.
+    One commit for the whole batch instead of one per message.
+    """
+    conn = get_connection(db_path)
+    with conn:
+        conn.cursor().executemany(_SQL_INSERT_MESSAGE, rows)
+    logger.debug("[DB] %d messages stored", len(rows))
\ No newline at end of file
@@ -20,22 +20,27 @@ def demonstrate_llm_sql_capabilities():
     # Create test database with sample data
     db = AgentDB("demo_llm_sql.db")
     
-    # Sample conversations and data
-    conv1 = db.create_conversation("Python Flask Project")
-    conv2 = db.create_conversation("Machine Learning Help")
-    
-    db.add_message(conv1, "user", "How do I create a REST API?")
-    db.add_message(conv1, "assistant", "Here's how to create a Flask REST API...")
-    db.add_message(conv2, "user", "What's the best ML algorithm for classification?")
-    db.add_message(conv2, "assistant", "For classification, consider these algorithms...")
-    
-    # Add tasks and memories
-    db.create_task(conv1, "Build API endpoints", "Create CRUD endpoints", 3)
-    task_completed = db.create_task(conv1, "Set up database", "Configure PostgreSQL", 2) 
-    db.update_task_status(task_completed, "completed")
-    
-    db.store_memory(conv1, "important_facts", "User prefers Flask framework", 3)
-    db.store_memory(conv2, "patterns", "User asks theoretical ML questions", 2)
+    # Sample conversations and data, written in one transaction (one commit instead of one per call)
+    with db.transaction():
+        conv1 = db.create_conversation("Python Flask Project")
+        conv2 = db.create_conversation("Machine Learning Help")
+        
+        db.add_messages_bulk([
+            (conv1, "user", "How do I create a REST API?"),
+            (conv1, "assistant", "Here's how to create a Flask REST API..."),
+            (conv2, "user", "What's the best ML algorithm for classification?"),
+            (conv2, "assistant", "For classification, consider these algorithms..."),
+        ])
+        
+        # Add tasks and memories
+        db.create_task(conv1, "Build API endpoints", "Create CRUD endpoints", 3)
+        task_completed = db.create_task(conv1, "Set up database", "Configure PostgreSQL", 2) 
+        db.update_task_status(task_completed, "completed")
+        
+        db.store_memories_bulk([
+            (conv1, "important_facts", "User prefers Flask framework", 3),
+            (conv2, "patterns", "User asks theoretical ML questions", 2),
+        ])
     
     print("✅ Sample data created")
     
@@ -122,7 +127,7 @@ def demonstrate_llm_sql_capabilities():
     
     # Get relevant context from database
     context_queries = [
-        ("User Preferences", "SELECT state_data FROM agent_state WHERE state_type = 'user_preferences'"),
+        ("User Preferences", "SELECT key, value_json FROM user_preferences"),
         ("Related Tasks", "SELECT task_name FROM tasks WHERE task_name LIKE '%API%' OR task_name LIKE '%auth%'"),
         ("Relevant Memories", "SELECT content FROM agent_memory WHERE content LIKE '%API%' OR content LIKE '%auth%'"),
     ]
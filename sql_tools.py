@@ -4,12 +4,31 @@ Provides safe SQL execution with proper constraints and validation
 """
 
 import apsw
-import json
+import itertools
+import os
 import re
-from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 import sqlite3
 
+# Search-term extractors for natural_language_to_sql, tried in order (compiled once at import)
+_SEARCH_TERM_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'search for "([^"]+)"',
+    r'search for \'([^\']+)\'',
+    r'search for ([A-Za-z]+)',
+    r'find messages about ([A-Za-z]+)',
+    r'search messages for ([A-Za-z]+)',
+    r'find ([A-Za-z]+)',
+))
+
+# Substrings of a user message that route it to the database tools (enhance_with_database_tools)
+_DATABASE_KEYWORDS = ('database', 'data', 'conversation', 'task', 'memory', 'history',
+                      'statistics', 'insight', 'search', 'find', 'show', 'how many')
+
+# Absolute db path -> [connection, reference count]; LLMSQLTools instances on one file share a connection
+_shared_connections: Dict[str, list] = {}
+
 class SQLSafetyValidator:
     """Validates SQL queries for safety before execution"""
     
@@ -29,6 +48,18 @@ class SQLSafetyValidator:
         r'--.*DROP',
         r'/\*.*DROP.*\*/',
     ]
+    # Lowercase keywords each pattern above needs; its regex only runs when all of them occur in the query
+    _PATTERN_KEYWORDS = [
+        (';', 'drop'),
+        (';', 'delete'),
+        ('pragma',),
+        ('attach',),
+        ('detach',),
+        ('--', 'drop'),
+        ('/*', 'drop'),
+    ]
+    # (keywords, compiled case-insensitive pattern) pairs, in DANGEROUS_PATTERNS order
+    _DANGEROUS_CHECKS = list(zip(_PATTERN_KEYWORDS, (re.compile(pattern, re.IGNORECASE) for pattern in DANGEROUS_PATTERNS)))
     
     # Required WHERE clause for dangerous operations
     REQUIRE_WHERE = ['DELETE', 'UPDATE']
@@ -39,17 +70,19 @@ class SQLSafetyValidator:
         Validate SQL query for safety
         Returns: (is_safe, error_message)
         """
-        sql_upper = sql.upper().strip()
+        sql_stripped = sql.strip()
+        sql_lower = sql_stripped.lower()
         
-        # Check for dangerous patterns
-        for pattern in cls.DANGEROUS_PATTERNS:
-            if re.search(pattern, sql_upper, re.IGNORECASE):
-                return False, f"Dangerous pattern detected: {pattern}"
+        # Check for dangerous patterns; plain substring tests rule most of them out without running a regex
+        for keywords, regex in cls._DANGEROUS_CHECKS:
+            if all(keyword in sql_lower for keyword in keywords) and regex.search(sql_stripped):
+                return False, f"Dangerous pattern detected: {regex.pattern}"
         
-        # Check for required WHERE clauses
-        for op in cls.REQUIRE_WHERE:
-            if sql_upper.strip().startswith(op) and 'WHERE' not in sql_upper:
-                return False, f"{op} queries must include a WHERE clause for safety"
+        # Check for required WHERE clauses (reusing the lowercased copy: one substring scan, no regex)
+        if 'where' not in sql_lower:
+            for op in cls.REQUIRE_WHERE:
+                if sql_lower.startswith(op.lower()):
+                    return False, f"{op} queries must include a WHERE clause for safety"
         
         # Block multiple statements (SQL injection prevention)
         if sql.count(';') > 1:
@@ -60,18 +93,69 @@ class SQLSafetyValidator:
 class LLMSQLTools:
     """SQL tools that the LLM can use to interact with the database"""
     
-    def __init__(self, db_path: str = "chat_history.db"):
+    # Memory-mapped I/O window in bytes and page cache size (negative = KiB)
+    MMAP_SIZE = 268435456  # 256 MiB
+    CACHE_SIZE = -65536    # 64 MiB
+    
+    # Entries kept in the execute_natural_language_query LRU
+    NL_CACHE_SIZE = 256
+    
+    # Recent requests natural_language_to_sql could not convert (users often retry the same phrasing)
+    NL_FAIL_CACHE_SIZE = 64
+    
+    # Size of apsw's per-connection prepared statement LRU (keyed on exact SQL text)
+    STATEMENT_CACHE_SIZE = 200
+    
+    def __init__(self, db_path: str = "chat_history.db", connection: Optional[apsw.Connection] = None):
+        """Use the caller's connection if given (never closed here), else the shared one for db_path"""
         self.db_path = db_path
-        self.connection = apsw.Connection(db_path)
+        self._shared_key = None
+        if connection is not None:
+            self.connection = connection
+        elif db_path in ("", ":memory:"):
+            # Private databases: sharing would make separate instances see each other's data
+            self.connection = apsw.Connection(db_path, statementcachesize=self.STATEMENT_CACHE_SIZE)
+            self.configure_connection()
+        else:
+            self._shared_key = os.path.abspath(db_path)
+            entry = _shared_connections.get(self._shared_key)
+            if entry is None:
+                self.connection = apsw.Connection(db_path, statementcachesize=self.STATEMENT_CACHE_SIZE)
+                self.configure_connection()
+                entry = _shared_connections[self._shared_key] = [self.connection, 0]
+            entry[1] += 1
+            self.connection = entry[0]
+        self._owns_connection = connection is None
         self.validator = SQLSafetyValidator()
+        self._fts_available = False
+        # get_schema_info result and the _db_versions() key it was built at
+        self._schema_cache = None
+        self._schema_cache_key = None
+        # (normalized request, row_limit, *_db_versions()) -> successful query result
+        self._nl_cache: OrderedDict = OrderedDict()
+        # request -> "could not convert" result; independent of the data, so never invalidated
+        self._nl_fail_cache: OrderedDict = OrderedDict()
     
-    def execute_sql(self, query: str, parameters: Optional[List] = None) -> Dict[str, Any]:
+    def configure_connection(self):
+        """Apply WAL journaling and PRAGMA tuning (same settings ChatHistory uses)"""
+        cursor = self.connection.cursor()
+        
+        # One PRAGMA per execute: a multi-statement execute pauses at journal_mode's result row
+        cursor.execute('PRAGMA journal_mode=WAL').fetchall()
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute(f'PRAGMA mmap_size={int(self.MMAP_SIZE)}').fetchall()
+        cursor.execute(f'PRAGMA cache_size={int(self.CACHE_SIZE)}')
+        cursor.execute('PRAGMA busy_timeout=3000')  # Wait for the chat app's writer instead of failing
+    
+    def execute_sql(self, query: str, parameters: Optional[List] = None, row_limit: Optional[int] = None) -> Dict[str, Any]:
         """
         Execute SQL query with safety validation
         
         Args:
             query: SQL query string
             parameters: Optional parameters for prepared statements
+            row_limit: Keep at most this many SELECT rows in "data" ("row_count" still counts them all)
             
         Returns:
             Dict with results, error info, and metadata
@@ -90,25 +174,13 @@ class LLMSQLTools:
             
             # Execute query and immediately fetch results for SELECT
             if query.strip().upper().startswith('SELECT'):
-                if parameters:
-                    rows = list(cursor.execute(query, parameters))
-                else:
-                    rows = list(cursor.execute(query))
-                
-                # Get column names from description
-                columns = []
-                if cursor.getdescription():
-                    columns = [desc[0] for desc in cursor.getdescription()]
-                else:
-                    # Fallback: try to infer columns from first row
-                    if rows and hasattr(rows[0], '__len__'):
-                        columns = [f"col_{i}" for i in range(len(rows[0]))]
+                rows, columns, row_count = self._fetch_rows(cursor, query, parameters or None, row_limit)
                 
                 return {
                     "success": True,
                     "data": rows,
                     "columns": columns,
-                    "row_count": len(rows),
+                    "row_count": row_count,
                     "query": query
                 }
             else:
@@ -132,47 +204,83 @@ class LLMSQLTools:
                 "query": query
             }
     
+    @staticmethod
+    def _fetch_rows(cursor: apsw.Cursor, query: str, parameters: Optional[Union[List, Tuple]] = None,
+                    row_limit: Optional[int] = None) -> Tuple[List[tuple], List[str], int]:
+        """Run a SELECT and return (rows, column names, total row count), keeping at most row_limit rows"""
+        cursor.execute(query, parameters)
+        try:
+            # Only available while the statement is still running, i.e. before the rows are consumed
+            columns = [desc[0] for desc in cursor.getdescription()]
+        except apsw.ExecutionCompleteError:
+            return [], [], 0  # No rows
+        
+        if row_limit is None:
+            rows = cursor.fetchall()
+            return rows, columns, len(rows)
+        
+        # Stream past the kept rows, counting the rest without materializing them
+        rows = list(itertools.islice(cursor, row_limit))
+        return rows, columns, len(rows) + sum(1 for _ in cursor)
+    
+    @staticmethod
+    def _db_versions(cursor: apsw.Cursor) -> Tuple[int, int, int]:
+        """Constant-time change marker: schema_version, data_version (commits by other connections)
+        and total_changes (writes through this connection, by any instance sharing it)"""
+        return (
+            cursor.execute("PRAGMA schema_version").fetchone()[0],
+            cursor.execute("PRAGMA data_version").fetchone()[0],
+            cursor.connection.total_changes()
+        )
+    
     def get_schema_info(self) -> Dict[str, Any]:
-        """Get database schema information for the LLM"""
+        """Get database schema information for the LLM (cached until the schema or data changes)"""
         try:
             cursor = self.connection.cursor()
             
-            # Get all tables
-            tables_query = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-            tables = [row[0] for row in cursor.execute(tables_query)]
+            cache_key = self._db_versions(cursor)
+            if self._schema_cache is not None and cache_key == self._schema_cache_key:
+                return self._schema_cache
+            
+            # Columns of every table in one statement (the full-text index and its shadow tables are internal)
+            columns_query = """
+                SELECT m.name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+                FROM sqlite_master m JOIN pragma_table_info(m.name) p
+                WHERE m.type = 'table' AND m.name NOT GLOB 'messages_fts*'
+                ORDER BY m.name, p.cid
+            """
+            table_columns = {}
+            for table, name, col_type, not_null, default, primary_key in cursor.execute(columns_query):
+                table_columns.setdefault(table, []).append({
+                    "name": name,
+                    "type": col_type,
+                    "not_null": bool(not_null),
+                    "default": default,
+                    "primary_key": bool(primary_key)
+                })
+            
+            # Exact row counts for every table in one statement; each row is labelled with its bound table name
+            row_counts = {}
+            if table_columns:
+                count_query = " UNION ALL ".join(
+                    'SELECT ?, COUNT(*) FROM "' + table.replace('"', '""') + '"' for table in table_columns
+                )
+                row_counts = dict(cursor.execute(count_query, list(table_columns)))
             
             schema_info = {
-                "tables": {},
-                "total_tables": len(tables)
+                "tables": {
+                    table: {"columns": columns, "row_count": row_counts[table]}
+                    for table, columns in table_columns.items()
+                },
+                "total_tables": len(table_columns)
             }
             
-            # Get schema for each table
-            for table in tables:
-                # Get columns
-                pragma_query = f"PRAGMA table_info({table})"
-                columns = []
-                for row in cursor.execute(pragma_query):
-                    columns.append({
-                        "name": row[1],
-                        "type": row[2],
-                        "not_null": bool(row[3]),
-                        "default": row[4],
-                        "primary_key": bool(row[5])
-                    })
-                
-                # Get row count
-                count_query = f"SELECT COUNT(*) FROM {table}"
-                row_count = list(cursor.execute(count_query))[0][0]
-                
-                schema_info["tables"][table] = {
-                    "columns": columns,
-                    "row_count": row_count
-                }
-            
-            return {
+            self._schema_cache = {
                 "success": True,
                 "schema": schema_info
             }
+            self._schema_cache_key = cache_key
+            return self._schema_cache
             
         except Exception as e:
             return {
@@ -185,7 +293,13 @@ class LLMSQLTools:
         Convert natural language request to SQL
         This is a simple rule-based converter - in production you'd use an LLM
         """
+        failed = self._nl_fail_cache.get(request)
+        if failed is not None:
+            self._nl_fail_cache.move_to_end(request)
+            return failed
+        
         request_lower = request.lower()
+        params = None
         
         # Simple pattern matching for common requests
         if "how many" in request_lower and "conversation" in request_lower:
@@ -201,10 +315,9 @@ class LLMSQLTools:
             
         elif "user preference" in request_lower and "show" in request_lower:
             sql = """
-            SELECT conversation_id, state_data 
-            FROM agent_state 
-            WHERE state_type = 'user_preferences'
-            ORDER BY timestamp DESC
+            SELECT conversation_id, key, value_json 
+            FROM user_preferences 
+            ORDER BY updated_at DESC
             """
             
         elif "active task" in request_lower:
@@ -227,15 +340,31 @@ class LLMSQLTools:
         elif "search" in request_lower:
             # Extract search term for various search patterns
             search_term = self._extract_search_term(request)
-            if search_term:
-                sql = f"""
+            if search_term and len(search_term) >= 3 and self._has_fts():
+                # Trigram full-text lookup (same substring semantics as LIKE); the term is quoted
+                # as one phrase so it is never parsed as FTS syntax
+                sql = """
+                SELECT m.content, m.role, m.timestamp, c.title
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                JOIN conversations c ON m.conversation_id = c.id
+                WHERE messages_fts MATCH ?
+                ORDER BY m.timestamp DESC
+                LIMIT 20
+                """
+                params = ['"' + search_term.replace('"', '""') + '"']
+            elif search_term:
+                # Trigrams need at least three characters (and older databases have no index): scan.
+                # Bound rather than interpolated: no injection, and one cached statement for every term
+                sql = """
                 SELECT m.content, m.role, m.timestamp, c.title
                 FROM messages m
                 JOIN conversations c ON m.conversation_id = c.id
-                WHERE m.content LIKE '%{search_term}%'
+                WHERE m.content LIKE ?
                 ORDER BY m.timestamp DESC
                 LIMIT 20
                 """
+                params = [f"%{search_term}%"]
             else:
                 return {
                     "success": False,
@@ -252,46 +381,59 @@ class LLMSQLTools:
             """
             
         else:
-            return {
+            failed = {
                 "success": False,
                 "error": f"Could not convert request to SQL: {request}",
                 "suggestion": "Try requests like: 'show recent conversations', 'how many conversations', 'show active tasks', etc."
             }
+            self._nl_fail_cache[request] = failed
+            while len(self._nl_fail_cache) > self.NL_FAIL_CACHE_SIZE:
+                self._nl_fail_cache.popitem(last=False)
+            return failed
         
         return {
             "success": True,
             "sql": sql,
+            "params": params,
             "original_request": request
         }
     
+    def _has_fts(self) -> bool:
+        """Whether the database has the messages_fts index ChatHistory maintains (a positive answer is cached)"""
+        if not self._fts_available:
+            cursor = self.connection.cursor()
+            self._fts_available = cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone()[0] > 0
+        return self._fts_available
+    
     def _extract_search_term(self, request: str) -> Optional[str]:
         """Extract search term from natural language request"""
-        patterns = [
-            r'search for "([^"]+)"',
-            r'search for \'([^\']+)\'',
-            r'search for ([A-Za-z]+)',
-            r'find messages about ([A-Za-z]+)',
-            r'search messages for ([A-Za-z]+)',
-            r'find ([A-Za-z]+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, request, re.IGNORECASE)
+        for pattern in _SEARCH_TERM_PATTERNS:
+            match = pattern.search(request)
             if match:
                 return match.group(1)
         
         return None
     
-    def execute_natural_language_query(self, request: str) -> Dict[str, Any]:
+    def execute_natural_language_query(self, request: str, row_limit: Optional[int] = None) -> Dict[str, Any]:
         """
         Execute a natural language database query
         
         Args:
             request: Natural language request
+            row_limit: Keep at most this many result rows (see execute_sql)
             
         Returns:
             Query results with metadata
         """
+        # Repeated requests are served from the LRU until the schema or data changes
+        cache_key = (request.lower().strip(), row_limit, *self._db_versions(self.connection.cursor()))
+        cached = self._nl_cache.get(cache_key)
+        if cached is not None:
+            self._nl_cache.move_to_end(cache_key)
+            return {**cached, "original_request": request}
+        
         # Convert to SQL
         sql_result = self.natural_language_to_sql(request)
         
@@ -299,14 +441,19 @@ class LLMSQLTools:
             return sql_result
         
         # Execute the generated SQL
-        execution_result = self.execute_sql(sql_result["sql"])
+        execution_result = self.execute_sql(sql_result["sql"], sql_result.get("params"), row_limit)
         
         # Combine results
-        return {
+        result = {
             **execution_result,
             "original_request": request,
             "generated_sql": sql_result["sql"]
         }
+        if result["success"]:
+            self._nl_cache[cache_key] = result
+            while len(self._nl_cache) > self.NL_CACHE_SIZE:
+                self._nl_cache.popitem(last=False)
+        return result
     
     def get_conversation_insights(self, conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """Get insights about conversations using SQL queries"""
@@ -319,7 +466,7 @@ class LLMSQLTools:
                 FROM messages 
                 {} 
                 GROUP BY role
-            """.format(f"WHERE conversation_id = '{conversation_id}'" if conversation_id else ""),
+            """.format("WHERE conversation_id = ?" if conversation_id else ""),
             
             "conversation_activity": """
                 SELECT 
@@ -335,7 +482,7 @@ class LLMSQLTools:
                 SELECT 
                     status,
                     COUNT(*) as task_count,
-                    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM tasks), 2) as percentage
+                    ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER (), 2) as percentage
                 FROM tasks
                 GROUP BY status
             """,
@@ -351,16 +498,22 @@ class LLMSQLTools:
             """
         }
         
+        params = {"message_stats": (conversation_id,) if conversation_id else None}
+        
+        # Fixed, trusted queries: skip execute_sql's validation and read them all in one transaction
+        # (one snapshot and one lock instead of four)
         insights = {}
-        for insight_name, query in queries.items():
-            result = self.execute_sql(query)
-            if result["success"]:
-                insights[insight_name] = {
-                    "data": result["data"],
-                    "columns": result["columns"]
-                }
-            else:
-                insights[insight_name] = {"error": result["error"]}
+        cursor = self.connection.cursor()
+        with self.connection:
+            for insight_name, query in queries.items():
+                try:
+                    rows, columns, _ = self._fetch_rows(cursor, query, params.get(insight_name))
+                    insights[insight_name] = {
+                        "data": rows,
+                        "columns": columns
+                    }
+                except Exception as e:
+                    insights[insight_name] = {"error": str(e)}
         
         return {
             "success": True,
@@ -369,15 +522,24 @@ class LLMSQLTools:
         }
     
     def close(self):
-        """Close database connection"""
-        if self.connection:
+        """Release the database connection (a shared one closes with its last user)"""
+        if not self.connection:
+            return
+        if self._shared_key is not None:
+            entry = _shared_connections[self._shared_key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _shared_connections[self._shared_key]
+                self.connection.close()
+        elif self._owns_connection:
             self.connection.close()
+        self.connection = None
 
 class LLMDatabaseInterface:
     """High-level interface for LLM database interactions"""
     
-    def __init__(self, db_path: str = "chat_history.db"):
-        self.sql_tools = LLMSQLTools(db_path)
+    def __init__(self, db_path: str = "chat_history.db", connection: Optional[apsw.Connection] = None):
+        self.sql_tools = LLMSQLTools(db_path, connection)
     
     def process_database_request(self, request: str) -> str:
         """
@@ -410,17 +572,17 @@ class LLMDatabaseInterface:
             return f"❌ Error getting schema: {result['error']}"
         
         schema = result["schema"]
-        response = f"📊 Database Schema ({schema['total_tables']} tables):\n\n"
+        parts = [f"📊 Database Schema ({schema['total_tables']} tables):\n\n"]
         
         for table_name, table_info in schema["tables"].items():
-            response += f"**{table_name}** ({table_info['row_count']} rows)\n"
+            parts.append(f"**{table_name}** ({table_info['row_count']} rows)\n")
             for col in table_info["columns"]:
                 pk = " (PRIMARY KEY)" if col["primary_key"] else ""
                 nn = " NOT NULL" if col["not_null"] else ""
-                response += f"  • {col['name']}: {col['type']}{pk}{nn}\n"
-            response += "\n"
+                parts.append(f"  • {col['name']}: {col['type']}{pk}{nn}\n")
+            parts.append("\n")
         
-        return response
+        return "".join(parts)
     
     def _handle_insights_request(self) -> str:
         """Handle requests for database insights"""
@@ -430,32 +592,32 @@ class LLMDatabaseInterface:
             return f"❌ Error getting insights: {result.get('error', 'Unknown error')}"
         
         insights = result["insights"]
-        response = "📈 Database Insights:\n\n"
+        parts = ["📈 Database Insights:\n\n"]
         
         # Message statistics
         if "message_stats" in insights and "data" in insights["message_stats"]:
-            response += "**Message Statistics:**\n"
+            parts.append("**Message Statistics:**\n")
             for row in insights["message_stats"]["data"]:
                 role, count, avg_length = row
-                response += f"  • {role.title()}: {count} messages (avg {avg_length:.0f} chars)\n"
-            response += "\n"
+                parts.append(f"  • {role.title()}: {count} messages (avg {avg_length:.0f} chars)\n")
+            parts.append("\n")
         
         # Task completion
         if "task_completion_rate" in insights and "data" in insights["task_completion_rate"]:
-            response += "**Task Completion:**\n"
+            parts.append("**Task Completion:**\n")
             for row in insights["task_completion_rate"]["data"]:
                 status, count, percentage = row
-                response += f"  • {status.title()}: {count} tasks ({percentage}%)\n"
-            response += "\n"
+                parts.append(f"  • {status.title()}: {count} tasks ({percentage}%)\n")
+            parts.append("\n")
         
         # Memory distribution
         if "memory_distribution" in insights and "data" in insights["memory_distribution"]:
-            response += "**Memory Distribution:**\n"
+            parts.append("**Memory Distribution:**\n")
             for row in insights["memory_distribution"]["data"]:
                 memory_type, count, avg_importance = row
-                response += f"  • {memory_type}: {count} memories (importance: {avg_importance:.1f})\n"
+                parts.append(f"  • {memory_type}: {count} memories (importance: {avg_importance:.1f})\n")
         
-        return response
+        return "".join(parts)
     
     def _handle_direct_sql_request(self, request: str) -> str:
         """Handle direct SQL execution requests"""
@@ -468,40 +630,42 @@ class LLMDatabaseInterface:
             return "❌ Could not extract SQL query from request. Please format as ```sql\nYOUR_QUERY\n```"
         
         sql_query = sql_match.group(1).strip()
-        result = self.sql_tools.execute_sql(sql_query)
+        result = self.sql_tools.execute_sql(sql_query, row_limit=20)
         
         if not result["success"]:
             return f"❌ SQL Error: {result['error']}\nQuery: {sql_query}"
         
         # Format results
-        if "data" in result:
-            response = f"✅ Query executed successfully ({result['row_count']} rows):\n\n"
+        if "data" not in result:
+            return f"✅ Query executed successfully. Changes: {result.get('changes', 0)}"
+        
+        parts = [f"✅ Query executed successfully ({result['row_count']} rows):\n\n"]
+        
+        if result["row_count"] > 0:
+            # Create table format
+            columns = result["columns"]
+            rows = result["data"]
+            sep = " | "
             
-            if result["row_count"] > 0:
-                # Create table format
-                columns = result["columns"]
-                rows = result["data"]
-                
-                # Header
-                response += " | ".join(columns) + "\n"
-                response += " | ".join(["-" * len(col) for col in columns]) + "\n"
-                
-                # Data rows (limit to first 20)
-                for row in rows[:20]:
-                    response += " | ".join([str(cell) if cell is not None else "NULL" for cell in row]) + "\n"
-                
-                if len(rows) > 20:
-                    response += f"\n... and {len(rows) - 20} more rows"
-            else:
-                response += "No data returned."
+            # Header
+            parts.append(sep.join(columns) + "\n")
+            parts.append(sep.join(["-" * len(col) for col in columns]) + "\n")
+            
+            # Data rows (limit to first 20)
+            for row in rows[:20]:
+                parts.append(sep.join([str(cell) if cell is not None else "NULL" for cell in row]))
+                parts.append("\n")
+            
+            if result["row_count"] > 20:
+                parts.append(f"\n... and {result['row_count'] - 20} more rows")
         else:
-            response = f"✅ Query executed successfully. Changes: {result.get('changes', 0)}"
+            parts.append("No data returned.")
         
-        return response
+        return "".join(parts)
     
     def _handle_natural_language_request(self, request: str) -> str:
         """Handle natural language database requests"""
-        result = self.sql_tools.execute_natural_language_query(request)
+        result = self.sql_tools.execute_natural_language_query(request, row_limit=10)
         
         if not result["success"]:
             error_msg = result.get("error", "Unknown error")
@@ -512,26 +676,30 @@ class LLMDatabaseInterface:
             return response
         
         # Format successful results
-        response = f"✅ Results for: '{result['original_request']}'\n"
-        response += f"Generated SQL: ```sql\n{result['generated_sql']}\n```\n\n"
+        parts = [
+            f"✅ Results for: '{result['original_request']}'\n",
+            f"Generated SQL: ```sql\n{result['generated_sql']}\n```\n\n"
+        ]
         
         if "data" in result and result["data"]:
             columns = result["columns"]
             rows = result["data"]
+            sep = " | "
             
             # Format as table
-            response += " | ".join(columns) + "\n"
-            response += " | ".join(["-" * len(col) for col in columns]) + "\n"
+            parts.append(sep.join(columns) + "\n")
+            parts.append(sep.join(["-" * len(col) for col in columns]) + "\n")
             
             for row in rows[:10]:  # Limit to first 10 rows
-                response += " | ".join([str(cell) if cell is not None else "NULL" for cell in row]) + "\n"
+                parts.append(sep.join([str(cell) if cell is not None else "NULL" for cell in row]))
+                parts.append("\n")
             
-            if len(rows) > 10:
-                response += f"\n... and {len(rows) - 10} more rows"
+            if result["row_count"] > 10:
+                parts.append(f"\n... and {result['row_count'] - 10} more rows")
         else:
-            response += "No data found."
+            parts.append("No data found.")
         
-        return response
+        return "".join(parts)
     
     def close(self):
         """Close database connection"""
@@ -547,13 +715,10 @@ def add_sql_tools_to_cerebras_client():
         # Check if the user is asking about database/data
         user_message = messages[-1].get('content', '') if messages else ''
         
-        database_keywords = ['database', 'data', 'conversation', 'task', 'memory', 'history', 
-                           'statistics', 'insight', 'search', 'find', 'show', 'how many']
-        
-        if any(keyword in user_message.lower() for keyword in database_keywords):
+        # Lowercase once; the generator used to re-lowercase the message for every keyword
+        message_lower = user_message.lower()
+        if any(keyword in message_lower for keyword in _DATABASE_KEYWORDS):
             # Add database interface context
-            db_interface = LLMDatabaseInterface()
-            
             system_message = {
                 "role": "system", 
                 "content": """You have access to database query tools. When users ask about data, conversations, tasks, or want insights:
@@ -570,7 +735,6 @@ Use the database tools to provide accurate, data-driven responses."""
             # Insert system message at the beginning
             enhanced_messages = [system_message] + messages
             
-            db_interface.close()
             return enhanced_messages
         
         return messages